@@ -0,0 +1,238 @@
+"""Admin analytics over every appointment, live and archived, served from rollups.
+
+Two rollup tables hold the whole appointment history by current status:
+appointment_daily_stats (per doctor, day and status: count and booking lead
+time) and appointment_slot_stats (per day, slot and doctor: pending or
+booked appointments). They are maintained by the write paths, like the
+occupancy index: crud records what a booking, status change or reschedule
+adds to and removes from the counters in session.info, and the deltas are
+upserted just before that transaction commits, so the rollups commit or roll
+back with the change itself. Every counter row a write touches is keyed by
+its own doctor, so writes for different doctors never contend on one row. Archiving moves rows without changing them and leaves the
+rollups alone. A report reads only the rollups for its date range, never the
+appointment tables.
+
+Rows written behind the app's back (benchmark seeding, manual SQL) are not
+counted; rebuild recomputes the rollups from both appointment tables and
+check compares them with a fresh aggregation.
+
+    python -m app.analytics [--rebuild | --check]
+"""
+import argparse
+import datetime
+import logging
+import sys
+from typing import Dict, Iterable
+from sqlalchemy import delete, event, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import database, migrations, models, schedules
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DELTAS = "rollup_deltas"
+
+SOURCE_COLUMNS = ("doctor_id", "date", "slot", "status", "created_at")
+
+# keys of each rollup, in primary key order; the other columns are counters
+DAILY_KEYS = ("doctor_id", "date", "status")
+SLOT_KEYS = ("date", "slot", "doctor_id")
+
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def aggregate(rows: Iterable, daily: Dict, slots: Dict, sign: int = 1):
+    """Fold (doctor_id, date, slot, status, created_at) rows into daily / slot counters; sign=-1 takes them out"""
+    for doctor_id, day, slot, status, created_at in rows:
+        if status is None:
+            continue
+        entry = daily.setdefault((doctor_id, day, status), [0, 0, 0])
+        entry[0] += sign
+        if created_at is not None:
+            # imported or clock-skewed rows can be created after their date; count them as same-day
+            entry[1] += sign * max((day - created_at.date()).days, 0)
+            entry[2] += sign
+        if status in models.ACTIVE_STATUSES:
+            entry = slots.setdefault((day, slot, doctor_id), [0])
+            entry[0] += sign
+
+
+def record_counted(db: Session, doctor_id, day, slot, status, created_at, sign: int = 1):
+    """Count (sign=1) or uncount (sign=-1) one appointment in the rollups when db commits"""
+    daily, slots = db.info.setdefault(ROLLUP_DELTAS, ({}, {}))
+    aggregate([(doctor_id, day, slot, status, created_at)], daily, slots, sign)
+
+
+def _upsert(db, model, key_names, counters: Dict):
+    """Add counters ({key tuple: [values]}) into a rollup with one executemany INSERT ... ON CONFLICT DO UPDATE"""
+    table = model.__table__
+    value_names = [c.name for c in table.columns if c.name not in key_names]
+    # sorted, so concurrent transactions lock the rows they share in the same order
+    rows = [
+        dict(zip(key_names, key), **dict(zip(value_names, values)))
+        for key, values in sorted(counters.items(), key=lambda item: [str(k) for k in item[0]])
+        if any(values)
+    ]
+    if not rows:
+        return
+    bind = db.get_bind() if isinstance(db, Session) else db
+    stmt = UPSERTS[bind.dialect.name](table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_names), set_={name: table.c[name] + stmt.excluded[name] for name in value_names}
+    )
+    db.execute(stmt, rows)
+
+
+def apply_deltas(db, daily: Dict, slots: Dict):
+    """Upsert counter deltas into both rollups; db is a Session or a Connection inside its transaction"""
+    _upsert(db, models.AppointmentDailyStats, DAILY_KEYS, daily)
+    _upsert(db, models.AppointmentSlotStats, SLOT_KEYS, slots)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_recorded_deltas(session):
+    deltas = session.info.pop(ROLLUP_DELTAS, None)
+    if deltas:
+        apply_deltas(session, *deltas)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_deltas(session, previous_transaction):
+    session.info.pop(ROLLUP_DELTAS, None)
+
+
+def source_rows(model, *criteria):
+    return select(*(getattr(model, name) for name in SOURCE_COLUMNS)).where(*criteria)
+
+
+def aggregate_all(db: Session):
+    """(daily, slots) counters over every live and archived appointment"""
+    daily, slots = {}, {}
+    for model in (models.Appointment, models.AppointmentArchive):
+        aggregate(db.execute(source_rows(model)), daily, slots)
+    return daily, slots
+
+
+def rebuild(db: Session) -> int:
+    """Recompute both rollups from the appointment tables in one transaction; returns the rollup rows written"""
+    if db.get_bind().dialect.name == "postgresql":
+        # hold off writers until the new counters are committed; their deltas then apply on top
+        db.execute(text("LOCK TABLE appointments, appointments_archive IN SHARE MODE"))
+    daily, slots = aggregate_all(db)
+    for model in (models.AppointmentDailyStats, models.AppointmentSlotStats):
+        db.execute(delete(model))
+    apply_deltas(db, daily, slots)
+    db.commit()
+    return sum(1 for values in daily.values() if any(values)) + sum(1 for values in slots.values() if any(values))
+
+
+def check(db: Session):
+    """Compare the rollups with a fresh aggregation of both appointment tables; returns discrepancy descriptions"""
+    daily, slots = aggregate_all(db)
+    problems = []
+    for model, key_names, expected in (
+        (models.AppointmentDailyStats, DAILY_KEYS, daily),
+        (models.AppointmentSlotStats, SLOT_KEYS, slots),
+    ):
+        table = model.__table__
+        value_names = [c.name for c in table.columns if c.name not in key_names]
+        actual = {
+            tuple(row[:len(key_names)]): list(row[len(key_names):])
+            for row in db.execute(select(*(table.c[name] for name in key_names + tuple(value_names))))
+        }
+        zero = [0] * len(value_names)
+        for key in sorted(expected.keys() | actual.keys(), key=lambda k: [str(part) for part in k]):
+            if expected.get(key, zero) != actual.get(key, zero):
+                problems.append(f"{table.name} {key}: appointments give {expected.get(key, zero)}, "
+                                f"rollup has {actual.get(key, zero)}")
+    return problems
+
+
+def _rates(row: dict) -> dict:
+    total = sum(row[status.lower()] for status in models.AppointmentStatus.__members__)
+    held = row["pending"] + row["booked"]
+    row["utilization"] = round(held / row["offered"], 4) if row["offered"] else 0.0
+    row["cancel_rate"] = round(row["cancelled"] / total, 4) if total else 0.0
+    row["reject_rate"] = round(row["rejected"] / total, 4) if total else 0.0
+    samples = row.pop("lead_samples")
+    row["avg_lead_days"] = round(row.pop("lead_days") / samples, 2) if samples else None
+    return row
+
+
+def _empty_row(offered: int = 0) -> dict:
+    row = {status.lower(): 0 for status in models.AppointmentStatus.__members__}
+    row.update(offered=offered, lead_days=0, lead_samples=0)
+    return row
+
+
+def report(db: Session, start: datetime.date, end: datetime.date, slot_limit: int = 10) -> dict:
+    """Per-doctor utilization, cancel/reject rates and lead time plus the busiest (weekday, slot) pairs"""
+    daily_stats, slot_stats = models.AppointmentDailyStats, models.AppointmentSlotStats
+
+    per_doctor = {}  # doctor_id -> row being built
+    for doctor_id, status, count, lead_days, lead_samples in db.execute(
+        select(daily_stats.doctor_id, daily_stats.status, func.sum(daily_stats.appointments),
+               func.sum(daily_stats.lead_days), func.sum(daily_stats.lead_samples))
+        .where(daily_stats.date >= start, daily_stats.date <= end)
+        .group_by(daily_stats.doctor_id, daily_stats.status)
+    ):
+        if not count:
+            continue
+        row = per_doctor.setdefault(doctor_id, _empty_row())
+        row[status.lower()] += count
+        row["lead_days"] += lead_days
+        row["lead_samples"] += lead_samples
+
+    by_weekday_slot = {}
+    for day, slot, count in db.execute(
+        select(slot_stats.date, slot_stats.slot, func.sum(slot_stats.appointments))
+        .where(slot_stats.date >= start, slot_stats.date <= end, slot_stats.appointments > 0)
+        .group_by(slot_stats.date, slot_stats.slot)
+    ):
+        by_weekday_slot[(day.weekday(), slot)] = by_weekday_slot.get((day.weekday(), slot), 0) + count
+    busiest = sorted(by_weekday_slot.items(), key=lambda item: (-item[1], item[0]))[:slot_limit]
+
+    # every verified doctor is listed, with or without appointments in the range
+    verified = db.execute(select(models.Doctor.id).where(models.Doctor.is_verified == 1)).scalars()
+    for doctor_id in verified:
+        per_doctor.setdefault(doctor_id, _empty_row())
+    doctor_schedules = schedules.cache.get_many(db, list(per_doctor))
+    days = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+    totals = _empty_row()
+    for doctor_id, row in per_doctor.items():
+        row["offered"] = sum(bin(doctor_schedules[doctor_id].open_mask(day)).count("1") for day in days)
+        for name, value in row.items():
+            totals[name] += value
+
+    return {
+        "start": start,
+        "end": end,
+        "totals": _rates(totals),
+        "doctors": [dict(_rates(row), doctor_id=doctor_id) for doctor_id, row in sorted(per_doctor.items())],
+        "busiest_slots": [{"weekday": weekday, "slot": slot, "appointments": count}
+                          for (weekday, slot), count in busiest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--rebuild", action="store_true", help="recompute the rollups from the appointment tables")
+    action.add_argument("--check", action="store_true", help="compare the rollups with the appointment tables")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        if args.rebuild:
+            print(f"rebuilt the analytics rollups: {rebuild(db)} rows")
+            return
+        problems = check(db)
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} discrepancies between the analytics rollups and the appointments")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Move past and cancelled/rejected appointments out of the live table.
+
+Archiving copies a row to appointments_archive (same id and columns plus
+archived_at) and deletes it from appointments, which releases its slot in
+uix_doctor_date_slot / uix_patient_date_slot, the occupancy index and the
+slot-change streams. A cancel moves its row in the same transaction
+(move_to_archive), so only pending/booked rows stay live; the archiver moves
+the ones dated more than ARCHIVE_RETAIN_DAYS days in the past, plus any
+terminal row an older version or an import left behind.
+
+Rows move in batches of ARCHIVE_BATCH_SIZE, one short transaction each, so a
+run never holds the write lock for long. The app runs it every
+ARCHIVE_INTERVAL_SECONDS in the background; it also runs from the command line:
+
+    python -m app.archive [--before YYYY-MM-DD] [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+from sqlalchemy import DateTime, delete, insert, literal, or_, select
+from sqlalchemy.orm import Session
+from . import config, database, migrations, models
+from .occupancy import record_released
+from .pubsub import record_slot_change
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = [c.name for c in models.Appointment.__table__.columns]
+
+
+def default_cutoff() -> datetime.date:
+    """Appointments dated before this are archived whatever their status"""
+    return datetime.date.today() - datetime.timedelta(days=config.ARCHIVE_RETAIN_DAYS)
+
+
+def archivable(cutoff: datetime.date):
+    return or_(models.Appointment.date < cutoff, models.Appointment.status.in_(models.TERMINAL_STATUSES))
+
+
+def move_to_archive(db, criteria, **overrides) -> int:
+    """Copy the live rows matching criteria to appointments_archive and delete them; returns the rows deleted
+
+    overrides replace column values on the way (a cancel archives the row with
+    its new status). Both statements repeat the criteria, so a row changed
+    in between is left alone by the DELETE; callers that need all or nothing
+    compare the count and roll back.
+    """
+    table = models.Appointment.__table__
+    columns = [
+        literal(overrides[name], table.c[name].type) if name in overrides else table.c[name]
+        for name in ARCHIVED_COLUMNS
+    ]
+    archived_at = literal(datetime.datetime.utcnow(), DateTime)
+    db.execute(insert(models.AppointmentArchive).from_select(
+        ARCHIVED_COLUMNS + ["archived_at"], select(*columns, archived_at).where(*criteria)
+    ))
+    return db.execute(
+        delete(models.Appointment).where(*criteria).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def archive_batch(db: Session, cutoff: datetime.date, batch_size: int) -> int:
+    """Move up to batch_size archivable appointments in one transaction; returns how many moved"""
+    rows = (
+        db.query(models.Appointment.id, models.Appointment.doctor_id, models.Appointment.date,
+                 models.Appointment.slot)
+        .filter(archivable(cutoff))
+        .order_by(models.Appointment.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        db.rollback()
+        return 0
+
+    # the predicate is repeated so a row changed since the SELECT (e.g. rescheduled) stays live
+    move_to_archive(db, [models.Appointment.id.in_([r.id for r in rows]), archivable(cutoff)])
+    today = datetime.date.today()
+    for r in rows:
+        record_released(db, r.doctor_id, r.date, r.slot, r.id)
+        if r.date >= today:
+            record_slot_change(db, r.doctor_id, r.date)
+    db.commit()
+    return len(rows)
+
+
+def count_archivable(db: Session, cutoff: datetime.date) -> int:
+    return db.query(models.Appointment.id).filter(archivable(cutoff)).count()
+
+
+def archive_all(db: Session, cutoff: datetime.date = None, batch_size: int = None) -> int:
+    """Archive everything archivable, batch by batch; returns the number of rows moved"""
+    cutoff = cutoff or default_cutoff()
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        moved = archive_batch(db, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+async def archive_all_async(batch_size: int = None) -> int:
+    """archive_all for the running app: each batch queues on the write lock like any other write"""
+    cutoff = default_cutoff()
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    total = 0
+    async with database.AsyncSessionLocal() as db:
+        while True:
+            async with database.write_lock():
+                moved = await db.run_sync(archive_batch, cutoff, batch_size)
+            total += moved
+            if moved < batch_size:
+                return total
+
+
+async def run_periodically(interval_seconds: int):
+    """Background job started by the app; errors are logged and retried on the next tick"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            moved = await archive_all_async()
+        except Exception:
+            logger.exception("archiving appointments failed")
+            continue
+        if moved:
+            logger.info("archived %d appointments", moved)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--before", type=datetime.date.fromisoformat,
+                        help=f"archive every appointment dated before this (default: today - {config.ARCHIVE_RETAIN_DAYS} days)")
+    parser.add_argument("--batch-size", type=int, default=config.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be archived")
+    args = parser.parse_args()
+    cutoff = args.before or default_cutoff()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        if args.dry_run:
+            print(f"{count_archivable(db, cutoff)} appointments would be archived (cutoff {cutoff})")
+            return
+        moved = archive_all(db, cutoff, args.batch_size)
+    print(f"archived {moved} appointments (cutoff {cutoff}, batches of {args.batch_size})")
+
+
+if __name__ == "__main__":
+    main()
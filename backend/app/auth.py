@@ -1,10 +1,13 @@
+import threading
+import time
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import Integer, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import database, models
+from . import config, database, hashing, models
 from types import SimpleNamespace
 
 # dev SECRET_KEY (replace in production)
@@ -12,7 +15,12 @@ SECRET_KEY = "change_this_dev_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 day
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# "db": resolve the principal from the database (through the principal cache)
+# "stateless": trust the role/id/is_verified claims carried by the token unless the
+# principal was invalidated after the token was issued. Invalidation is in-process,
+# so only use "stateless" with a single worker process.
+AUTH_MODE = config.AUTH_MODE
+PRINCIPAL_CACHE_TTL_SECONDS = config.PRINCIPAL_CACHE_TTL_SECONDS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
@@ -21,58 +29,151 @@ ADMIN_EMAIL = "admin@hospital.com"
 ADMIN_PASSWORD = "admin123"
 
 
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+class PrincipalCache:
+    """Short-TTL in-process cache of authenticated principals keyed by (role, id)"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # (role, id) -> (expires_at, principal)
+        self._invalidated_at = {}  # (role, id) -> unix time of the last invalidation
+        self._lock = threading.Lock()
+
+    def get(self, role: str, user_id: int):
+        with self._lock:
+            entry = self._entries.get((role, user_id))
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[(role, user_id)]
+                return None
+            return principal
+
+    def put(self, principal):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[(principal.role, principal.id)] = (time.monotonic() + self.ttl_seconds, principal)
+
+    def invalidate(self, role: str, user_id: int):
+        """Drop the cached principal and distrust every token issued before now"""
+        now = time.time()
+        with self._lock:
+            self._entries.pop((role, user_id), None)
+            self._invalidated_at[(role, user_id)] = now
+            # tokens older than ACCESS_TOKEN_EXPIRE_MINUTES are rejected anyway
+            horizon = now - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+            for key in [k for k, t in self._invalidated_at.items() if t < horizon]:
+                del self._invalidated_at[key]
+
+    def issued_before_invalidation(self, role: str, user_id: int, issued_at) -> bool:
+        with self._lock:
+            invalidated_at = self._invalidated_at.get((role, user_id))
+        if invalidated_at is None:
+            return False
+        # iat has one-second resolution, so a token from the same second counts as stale
+        return issued_at is None or issued_at <= int(invalidated_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidated_at.clear()
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 
-def authenticate_user(db: Session, email: str, password: str):
+def find_login_candidates(db: Session, email: str):
+    """Doctor and/or patient accounts registered under this email, with their password hashes (one query)"""
+    doctors = select(
+        literal("doctor").label("role"),
+        models.Doctor.id,
+        models.Doctor.email,
+        models.Doctor.name,
+        models.Doctor.hashed_password,
+        models.Doctor.is_verified,
+    ).where(models.Doctor.email == email)
+    patients = select(
+        literal("patient").label("role"),
+        models.Patient.id,
+        models.Patient.email,
+        models.Patient.name,
+        models.Patient.hashed_password,
+        literal(1, Integer).label("is_verified"),
+    ).where(models.Patient.email == email)
+
+    # 👨‍⚕️ DOCTOR first, then 🧑‍🦱 PATIENT, as before
+    rows = db.execute(union_all(doctors, patients)).all()
+    return sorted(rows, key=lambda r: r.role != "doctor")
+
+
+def _principal(candidate):
+    # never hand the password hash beyond the login path
+    return SimpleNamespace(id=candidate.id, role=candidate.role, email=candidate.email, is_verified=candidate.is_verified, name=candidate.name)
 
-    # 🔐 ADMIN LOGIN (HARDCODED)
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    """The admin, doctor or patient behind an email/password, or None; argon2 runs on the hashing pool"""
     if email == ADMIN_EMAIL and password == ADMIN_PASSWORD:
         return SimpleNamespace(id=0, role="admin", email=email, is_verified=True)
 
-    # 👨‍⚕️ DOCTOR
-    doctor = db.query(models.Doctor).filter(models.Doctor.email == email).first()
-    if doctor and verify_password(password, doctor.hashed_password):
-        # Return doctor object with is_verified flag - let frontend handle verification status
-        return SimpleNamespace(id=doctor.id, role="doctor", email=doctor.email, is_verified=doctor.is_verified, name=doctor.name)
-
-    # 🧑‍🦱 PATIENT
-    patient = db.query(models.Patient).filter(models.Patient.email == email).first()
-    if patient and verify_password(password, patient.hashed_password):
-        return SimpleNamespace(id=patient.id, role="patient", email=patient.email, is_verified=True, name=patient.name)
+    candidates = await db.run_sync(find_login_candidates, email)
+    for candidate in candidates:
+        if await hashing.verify_password(password, candidate.hashed_password):
+            return _principal(candidate)
 
+    if not candidates:
+        await hashing.verify_password(password, hashing.dummy_hash())
     return None
 
 
 
 
-def get_db():
-    yield from database.get_db()
+async def get_db():
+    async for db in database.get_async_db():
+        yield db
 
 
-from types import SimpleNamespace
+def load_principal(db: Session, role: str, user_id: int):
+    """Rebuild the principal for a doctor/patient id from the database; None if it no longer exists"""
+    # DOCTOR
+    if role == "doctor":
+        doctor = (
+            db.query(models.Doctor)
+            .filter(models.Doctor.id == user_id)
+            .first()
+        )
+        if not doctor:
+            return None
+        return SimpleNamespace(id=doctor.id, role="doctor", email=doctor.email, is_verified=doctor.is_verified, name=doctor.name)
+
+    # PATIENT
+    patient = (
+        db.query(models.Patient)
+        .filter(models.Patient.id == user_id)
+        .first()
+    )
+    if not patient:
+        return None
+    return SimpleNamespace(id=patient.id, role="patient", email=patient.email, is_verified=True, name=patient.name)
+
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,30 +192,32 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    # DOCTOR
-    if role == "doctor":
-        doctor = (
-            db.query(models.Doctor)
-            .filter(models.Doctor.id == user_id)
-            .first()
-        )
-        if not doctor:
-            raise credentials_exception
-        return SimpleNamespace(id=doctor.id, role="doctor", email=doctor.email, is_verified=doctor.is_verified, name=doctor.name)
-
-    # PATIENT
-    if role == "patient":
-        patient = (
-            db.query(models.Patient)
-            .filter(models.Patient.id == user_id)
-            .first()
-        )
-        if not patient:
-            raise credentials_exception
-        return SimpleNamespace(id=patient.id, role="patient", email=patient.email, is_verified=True, name=patient.name)
-
     # ADMIN
     if role == "admin":
         return SimpleNamespace(id=0, role="admin", email=email, is_verified=True)
 
-    raise credentials_exception
+    if role not in ("doctor", "patient"):
+        raise credentials_exception
+
+    cached = principal_cache.get(role, user_id)
+    if cached is not None and cached.email == email:
+        return cached
+
+    # STATELESS: the token already carries everything authorization needs
+    if (
+        AUTH_MODE == "stateless"
+        and "is_verified" in payload
+        and not principal_cache.issued_before_invalidation(role, user_id, payload.get("iat"))
+    ):
+        principal = SimpleNamespace(
+            id=user_id, role=role, email=email, is_verified=payload["is_verified"], name=payload.get("name")
+        )
+        principal_cache.put(principal)
+        return principal
+
+    principal = await db.run_sync(load_principal, role, user_id)
+    if principal is None:
+        raise credentials_exception
+
+    principal_cache.put(principal)
+    return principal
@@ -0,0 +1,330 @@
+"""Bulk import of doctors, patients and historical appointments from CSV or NDJSON.
+
+Input is read as a stream and handled CHUNK_ROWS rows at a time. Each chunk
+is validated against the import row schemas, checked for duplicates with one
+IN query per unique key (plus a set for duplicates within the file;
+appointments are also checked against the archive), hashed
+across a process pool and written with one executemany INSERT per table in
+a single transaction. Rows that fail are skipped and reported with their
+line number; they never abort the import.
+
+After every committed chunk the number of input rows consumed goes to a
+checkpoint file (default: the input path plus ".checkpoint"), and a rerun
+resumes after it. A crash between the commit and the checkpoint write only
+replays one chunk, whose rows are then rejected as duplicates.
+
+    python -m app.bulk_import {doctors,patients,appointments} FILE [--format csv|ndjson]
+        [--chunk-size 1000] [--workers N] [--checkpoint PATH] [--errors PATH]
+
+FILE may be "-" for stdin (no checkpoint unless --checkpoint is given).
+Doctors need name, email, license_number and password or hashed_password
+(an existing argon2 hash, imported as is); patients need name, email and a
+password. Appointments name the doctor and patient by id or email and are
+not checked against schedules: they are history. Cancelled/rejected rows go
+to the archive in the chunk's transaction, so they never hold a slot; past
+rows are moved there by the archiver like any others. The chunk's rows are
+added to the analytics rollups in the same transaction.
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import func, select, tuple_
+from . import analytics, archive, config, database, hashing, migrations, models, schemas
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 1000
+
+ROW_SCHEMAS = {
+    "doctors": schemas.DoctorImportRow,
+    "patients": schemas.PatientImportRow,
+    "appointments": schemas.AppointmentImportRow,
+}
+
+
+class Rejected(Exception):
+    """A row that cannot be imported; the message is reported with its line number"""
+
+
+def read_records(stream, fmt: str, skip: int = 0) -> Iterator[Tuple[int, dict]]:
+    """(line number, raw record) pairs; the first `skip` records are passed over unparsed where possible"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for index, record in enumerate(reader):
+            if index >= skip:
+                # empty cells mean "not given", so optional columns fall back to their defaults
+                yield reader.line_num, {k: v for k, v in record.items() if v not in ("", None)}
+        return
+    index = 0
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        index += 1
+        if index <= skip:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+
+
+def chunks(records: Iterator, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Importer:
+    """Validates, deduplicates, hashes and inserts one chunk at a time for one kind of row"""
+
+    def __init__(self, kind: str, conn, executor: ProcessPoolExecutor, workers: int):
+        self.kind = kind
+        self.workers = workers
+        self.schema = ROW_SCHEMAS[kind]
+        self.conn = conn
+        self.executor = executor
+
+    def validate(self, chunk) -> Tuple[list, list]:
+        valid, errors = [], []
+        for line_no, record in chunk:
+            if isinstance(record, Exception):
+                errors.append((line_no, f"invalid JSON: {record}"))
+                continue
+            try:
+                valid.append((line_no, self.schema(**record)))
+            except ValidationError as e:
+                errors.append((line_no, "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+                )))
+            except TypeError as e:
+                errors.append((line_no, f"not an object: {e}"))
+        return valid, errors
+
+    def process(self, chunk) -> Tuple[int, List[Tuple[int, str]]]:
+        """Import one chunk in one transaction; returns (rows inserted, [(line, reason)])"""
+        valid, errors = self.validate(chunk)
+        prepare = {"doctors": self.prepare_doctors, "patients": self.prepare_patients,
+                   "appointments": self.prepare_appointments}[self.kind]
+        accepted = []
+        for line_no, values in prepare(valid):
+            if isinstance(values, Rejected):
+                errors.append((line_no, str(values)))
+            else:
+                accepted.append(values)
+        if self.kind != "appointments":
+            self.hash_passwords(accepted)
+        if accepted:
+            table = {"doctors": models.Doctor, "patients": models.Patient,
+                     "appointments": models.Appointment}[self.kind].__table__
+            with self.conn.begin():
+                if self.kind == "appointments":
+                    # ids only grow (AUTOINCREMENT / sequence), so this chunk's rows are the ones above it
+                    last_id = self.conn.execute(select(func.max(models.Appointment.id))).scalar() or 0
+                self.conn.execute(table.insert(), accepted)
+                if self.kind == "appointments":
+                    archive.move_to_archive(self.conn, [
+                        models.Appointment.id > last_id, models.Appointment.status.in_(models.TERMINAL_STATUSES),
+                    ])
+                    daily, slots = {}, {}
+                    analytics.aggregate(
+                        ((r["doctor_id"], r["date"], r["slot"], r["status"], r["created_at"]) for r in accepted),
+                        daily, slots,
+                    )
+                    analytics.apply_deltas(self.conn, daily, slots)
+        return len(accepted), sorted(errors)
+
+    def hash_passwords(self, rows: List[dict]):
+        pending = [row for row in rows if "hashed_password" not in row]
+        hashed = self.executor.map(hashing.hash_sync, [row.pop("password") for row in pending],
+                                   chunksize=max(1, len(pending) // (4 * self.workers)))
+        for row, hashed_password in zip(pending, hashed):
+            row["hashed_password"] = hashed_password
+
+    def existing(self, column, values) -> set:
+        if not values:
+            return set()
+        return set(self.conn.execute(select(column).where(column.in_(values))).scalars())
+
+    def account_values(self, row) -> dict:
+        values = {"name": row.name, "email": row.email}
+        if row.hashed_password:
+            values["hashed_password"] = row.hashed_password
+        else:
+            values["password"] = row.password
+        return values
+
+    def prepare_doctors(self, valid):
+        taken_emails = self.existing(models.Doctor.email, {row.email for _, row in valid})
+        taken_licenses = self.existing(models.Doctor.license_number, {row.license_number for _, row in valid})
+        for line_no, row in valid:
+            if row.email in taken_emails:
+                yield line_no, Rejected(f"email already registered: {row.email}")
+            elif row.license_number in taken_licenses:
+                yield line_no, Rejected(f"license number already registered: {row.license_number}")
+            else:
+                taken_emails.add(row.email)
+                taken_licenses.add(row.license_number)
+                yield line_no, dict(self.account_values(row), license_number=row.license_number,
+                                    is_verified=row.is_verified)
+
+    def prepare_patients(self, valid):
+        taken = self.existing(models.Patient.email, {row.email for _, row in valid})
+        for line_no, row in valid:
+            if row.email in taken:
+                yield line_no, Rejected(f"email already registered: {row.email}")
+            else:
+                taken.add(row.email)
+                yield line_no, self.account_values(row)
+
+    def resolve(self, model, party: str, valid) -> Dict:
+        """Map every id and email the chunk uses for `party` to an existing id"""
+        ids = {getattr(row, f"{party}_id") for _, row in valid} - {None}
+        emails = {getattr(row, f"{party}_email") for _, row in valid} - {None}
+        found = {}
+        if ids or emails:
+            query = select(model.id, model.email).where(model.id.in_(ids) | model.email.in_(emails))
+            for user_id, email in self.conn.execute(query):
+                found[user_id] = user_id
+                found[email] = user_id
+        return found
+
+    def prepare_appointments(self, valid):
+        imported_at = datetime.datetime.utcnow()
+        doctors = self.resolve(models.Doctor, "doctor", valid)
+        patients = self.resolve(models.Patient, "patient", valid)
+        resolved = []
+        for line_no, row in valid:
+            doctor_key = row.doctor_id if row.doctor_id is not None else row.doctor_email
+            patient_key = row.patient_id if row.patient_id is not None else row.patient_email
+            if doctor_key not in doctors:
+                yield line_no, Rejected(f"unknown doctor: {doctor_key}")
+            elif patient_key not in patients:
+                yield line_no, Rejected(f"unknown patient: {patient_key}")
+            else:
+                resolved.append((line_no, row, doctors[doctor_key], patients[patient_key]))
+
+        # uix_doctor_date_slot / uix_patient_date_slot cover every status, so every row is checked
+        appt = models.Appointment
+        doctor_keys = {(doctor_id, row.date, row.slot) for _, row, doctor_id, _ in resolved}
+        patient_keys = {(patient_id, row.date, row.slot) for _, row, _, patient_id in resolved}
+        taken_doctor = set(map(tuple, self.conn.execute(
+            select(appt.doctor_id, appt.date, appt.slot)
+            .where(tuple_(appt.doctor_id, appt.date, appt.slot).in_(doctor_keys))
+        ))) if doctor_keys else set()
+        taken_patient = set(map(tuple, self.conn.execute(
+            select(appt.patient_id, appt.date, appt.slot)
+            .where(tuple_(appt.patient_id, appt.date, appt.slot).in_(patient_keys))
+        ))) if patient_keys else set()
+        # cancelled/rejected and past rows live in the archive, which has no unique keys: a row that is
+        # already there with the same patient and status was imported before (a replayed chunk)
+        archived = models.AppointmentArchive
+        already_archived = set(map(tuple, self.conn.execute(
+            select(archived.doctor_id, archived.patient_id, archived.date, archived.slot, archived.status)
+            .where(tuple_(archived.doctor_id, archived.date, archived.slot).in_(doctor_keys))
+        ))) if doctor_keys else set()
+        for line_no, row, doctor_id, patient_id in resolved:
+            doctor_key, patient_key = (doctor_id, row.date, row.slot), (patient_id, row.date, row.slot)
+            if (doctor_id, patient_id, row.date, row.slot, row.status) in already_archived:
+                yield line_no, Rejected(f"already archived: patient {patient_id} with doctor {doctor_id}, "
+                                        f"slot {row.slot} on {row.date}, {row.status}")
+                continue
+            if doctor_key in taken_doctor:
+                yield line_no, Rejected(f"slot {row.slot} on {row.date} already booked with doctor {doctor_id}")
+                continue
+            if patient_key in taken_patient:
+                yield line_no, Rejected(f"patient {patient_id} already has slot {row.slot} on {row.date}")
+                continue
+            taken_doctor.add(doctor_key)
+            taken_patient.add(patient_key)
+            # executemany needs the same keys in every row, so created_at is always set here
+            yield line_no, {"doctor_id": doctor_id, "patient_id": patient_id, "date": row.date, "slot": row.slot,
+                            "status": row.status, "is_rescheduled": row.is_rescheduled,
+                            "created_at": row.created_at or imported_at}
+
+
+def read_checkpoint(path: str, kind: str) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("kind") != kind:
+        raise SystemExit(f"checkpoint {path} belongs to a {state.get('kind')} import, not {kind}")
+    return state["rows"]
+
+
+def write_checkpoint(path: str, kind: str, rows: int):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"kind": kind, "rows": rows}, f)
+    os.replace(tmp, path)  # atomic, so a crash never leaves a torn checkpoint
+
+
+def run(kind: str, stream, fmt: str, chunk_size: int = CHUNK_ROWS, workers: int = None,
+        checkpoint: str = None, errors_out=None) -> Tuple[int, int]:
+    """Import everything after the checkpoint; returns (rows inserted, rows rejected)"""
+    done = read_checkpoint(checkpoint, kind)
+    if done:
+        logger.info("resuming %s import after %d rows", kind, done)
+    inserted = rejected = 0
+    workers = workers or config.HASH_WORKERS
+    with ProcessPoolExecutor(max_workers=workers) as executor, database.engine.connect() as conn:
+        importer = Importer(kind, conn, executor, workers)
+        for chunk in chunks(read_records(stream, fmt, skip=done), chunk_size):
+            added, errors = importer.process(chunk)
+            done += len(chunk)
+            write_checkpoint(checkpoint, kind, done)
+            inserted += added
+            rejected += len(errors)
+            for line_no, reason in errors:
+                if errors_out is not None:
+                    errors_out.write(json.dumps({"line": line_no, "error": reason}) + "\n")
+            logger.info("%s: %d rows read, %d inserted, %d rejected", kind, done, inserted, rejected)
+    return inserted, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=sorted(ROW_SCHEMAS))
+    parser.add_argument("file", help='CSV or NDJSON file, or "-" for stdin')
+    parser.add_argument("--format", choices=("csv", "ndjson"),
+                        help="input format (default: from the file extension, csv for stdin)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS, help="rows per transaction")
+    parser.add_argument("--workers", type=int, default=config.HASH_WORKERS, help="password hashing processes")
+    parser.add_argument("--checkpoint", help='resume file (default: FILE.checkpoint; none for "-")')
+    parser.add_argument("--errors", help="write rejected rows here as NDJSON (default: stderr)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    fmt = args.format or ("ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv")
+    checkpoint = args.checkpoint or (None if args.file == "-" else args.file + ".checkpoint")
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    stream = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+    errors_out = open(args.errors, "a") if args.errors else sys.stderr
+    try:
+        inserted, rejected = run(args.kind, stream, fmt, args.chunk_size, args.workers, checkpoint, errors_out)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if errors_out is not sys.stderr:
+            errors_out.close()
+    print(f"imported {inserted} {args.kind}, rejected {rejected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""In-process caching of serialized responses."""
+import hashlib
+import threading
+import time
+
+
+class ResponseCache:
+    """One serialized response body, invalidated by bumping a version counter
+
+    Writers call invalidate() after committing a change that affects the body.
+    The TTL bounds staleness in other worker processes, which never see that call.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._version = 0
+        self._entry = None  # (version, expires_at, body, etag)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entry = None
+
+    def get(self):
+        """(body, etag) if a fresh entry exists, else None"""
+        entry = self._entry
+        if entry is None:
+            return None
+        version, expires_at, body, etag = entry
+        if version != self._version or expires_at < time.monotonic():
+            return None
+        return body, etag
+
+    def put(self, version: int, body: bytes):
+        """Store a body built while the cache was at `version`; returns (body, etag)"""
+        # content hash, so every worker hands out the same tag for the same directory
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        with self._lock:
+            # an invalidation raced with the build: serve it, but do not cache it
+            if version == self._version:
+                self._entry = (version, time.monotonic() + self.ttl_seconds, body, etag)
+        return body, etag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """RFC 7232 weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
@@ -0,0 +1,49 @@
+"""Runtime settings, read once from environment variables."""
+import os
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+# database
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./appointments.db")
+# "production": WAL + the pragmas below on every SQLite connection; "default": SQLite's own defaults
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+DB_POOL_SIZE = _int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _int("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = _int("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _int("DB_POOL_RECYCLE", 3600)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_SIZE = _int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+SQLITE_CACHE_SIZE_KB = _int("SQLITE_CACHE_SIZE_KB", 64 * 1024)
+
+# request instrumentation: Server-Timing header on every response, and the
+# statement duration (ms) from which queries are logged as slow (0 disables the log)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+SLOW_QUERY_MS = _int("SLOW_QUERY_MS", 0)
+
+# authentication
+AUTH_MODE = os.getenv("AUTH_MODE", "db")
+PRINCIPAL_CACHE_TTL_SECONDS = _int("PRINCIPAL_CACHE_TTL_SECONDS", 60)
+
+# cached doctor directory (GET /doctors); bounds staleness across worker processes
+DOCTOR_DIRECTORY_TTL_SECONDS = _int("DOCTOR_DIRECTORY_TTL_SECONDS", 300)
+
+# per-doctor schedule templates cached in process; bounds staleness across worker processes
+SCHEDULE_CACHE_TTL_SECONDS = _int("SCHEDULE_CACHE_TTL_SECONDS", 60)
+
+# in-process slot occupancy index serving availability without queries (single worker only)
+OCCUPANCY_INDEX = os.getenv("OCCUPANCY_INDEX", "0") == "1"
+
+# archiving of past and cancelled/rejected appointments out of the live table (app/archive.py):
+# how often the in-app job runs (0 disables it), rows moved per transaction, and how many
+# days after their date past appointments stay live
+ARCHIVE_INTERVAL_SECONDS = _int("ARCHIVE_INTERVAL_SECONDS", 60)
+ARCHIVE_BATCH_SIZE = _int("ARCHIVE_BATCH_SIZE", 500)
+ARCHIVE_RETAIN_DAYS = _int("ARCHIVE_RETAIN_DAYS", 1)
+
+# password hashing pool
+HASH_WORKERS = _int("HASH_WORKERS", os.cpu_count() or 2)
+HASH_MAX_QUEUE = _int("HASH_MAX_QUEUE", HASH_WORKERS * 4)
@@ -1,41 +1,137 @@
+import base64
+import datetime
+from typing import Dict, NamedTuple, Tuple
 from passlib.context import CryptContext
+from sqlalchemy import insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy.orm.attributes import set_committed_value
+from . import archive, models, schemas, schedules
+from .analytics import record_counted
+from .occupancy import record_booked, record_released
+from .pubsub import record_slot_change
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
+# column-only projections for list reads: rows carry exactly the fields of the
+# matching output schema, no identity map entries and never hashed_password
+DIRECTORY_COLUMNS = (models.Doctor.id, models.Doctor.name, models.Doctor.email)
+DOCTOR_COLUMNS = DIRECTORY_COLUMNS + (models.Doctor.license_number, models.Doctor.is_verified)
+APPOINTMENT_COLUMNS = (
+    models.Appointment.id,
+    models.Appointment.doctor_id,
+    models.Appointment.patient_id,
+    models.Appointment.date,
+    models.Appointment.slot,
+    models.Appointment.status,
+    models.Appointment.is_rescheduled,
+)
+ARCHIVE_COLUMNS = tuple(getattr(models.AppointmentArchive, c.key) for c in APPOINTMENT_COLUMNS) + (
+    models.AppointmentArchive.archived_at,
+)
+
+
+class BookingConflict(Exception):
+    """A booking or reschedule was refused by one of the appointment unique constraints"""
+
+    MESSAGES = {
+        "uix_doctor_date_slot": "Slot already booked",
+        "uix_patient_date_slot": "Patient already has appointment at this slot",
+    }
+
+    def __init__(self, constraint: str):
+        self.constraint = constraint
+        super().__init__(self.MESSAGES[constraint])
+
+
+class AppointmentChanged(Exception):
+    """The appointment's status changed between the handler loading it and the guarded UPDATE"""
+
+    def __init__(self):
+        super().__init__("Appointment was changed by another request, please reload")
+
+
+class ScheduleConflict(Exception):
+    """A schedule change would move or drop the slot of upcoming pending/booked appointments
+
+    An appointment stores only its slot number, so a template or exception that
+    changes what that number means on its date would silently move the booking.
+    """
+
+    def __init__(self, appointment_ids):
+        self.appointment_ids = appointment_ids
+        super().__init__(
+            "Schedule change would move or remove the slot of upcoming appointments "
+            f"{', '.join(map(str, appointment_ids))}; cancel or reschedule them first"
+        )
+
+
+class Transition(NamedTuple):
+    sources: Tuple[str, ...]  # statuses the action may start from
+    target: str
+    error: str  # why it is refused when the appointment is in none of the sources
+
+
+# every status change goes through this table; the UPDATE is guarded by `status IN sources`
+TRANSITIONS = {
+    "approve": Transition(("PENDING",), "BOOKED", "Only pending appointments can be approved"),
+    # the doctor's /reject, bulk-reject and DELETE all end in CANCELLED; no endpoint produces REJECTED,
+    # which only appears on imported or older rows
+    "cancel": Transition(("PENDING", "BOOKED"), "CANCELLED", "Appointment is already cancelled or rejected"),
+    "patient_cancel": Transition(("BOOKED",), "CANCELLED", "Can only cancel confirmed appointments"),
+    "reschedule": Transition(("BOOKED",), "PENDING", "Can only reschedule confirmed appointments"),
+}
+
+
+class InvalidTransition(ValueError):
+    """The appointment's current status does not allow the action"""
+
+    def __init__(self, action: str):
+        self.action = action
+        super().__init__(TRANSITIONS[action].error)
+
+
+def booking_conflict(e: IntegrityError):
+    """Map an IntegrityError to the BookingConflict for the violated constraint, or None"""
+    message = str(e.orig)
+    # Postgres names the constraint, SQLite lists its columns
+    if "uix_doctor_date_slot" in message or "appointments.doctor_id" in message:
+        return BookingConflict("uix_doctor_date_slot")
+    if "uix_patient_date_slot" in message or "appointments.patient_id" in message:
+        return BookingConflict("uix_patient_date_slot")
+    return None
+
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def create_doctor(db: Session, doc_in: schemas.DoctorCreate):
-    """Create a new doctor"""
-    # Check if email already exists
-    existing_email = db.query(models.Doctor).filter(models.Doctor.email == doc_in.email).first()
-    if existing_email:
+def create_doctor(db: Session, doc_in: schemas.DoctorCreate, hashed_password: str = None):
+    """Create a new doctor; pass hashed_password when the hash was computed elsewhere (hashing pool)"""
+    # email and license number are checked with one SELECT; email wins when both are taken
+    taken = db.query(models.Doctor.email, models.Doctor.license_number).filter(
+        or_(models.Doctor.email == doc_in.email, models.Doctor.license_number == doc_in.license_number)
+    ).all()
+    if any(row.email == doc_in.email for row in taken):
         raise ValueError("Email already registered")
-    
-    # Check if license already exists
-    existing_license = db.query(models.Doctor).filter(models.Doctor.license_number == doc_in.license_number).first()
-    if existing_license:
+    if taken:
         raise ValueError("License number already registered")
-    
+
     db_doctor = models.Doctor(
         name=doc_in.name,
         email=doc_in.email,
-        hashed_password=get_password_hash(doc_in.password),
+        hashed_password=hashed_password or get_password_hash(doc_in.password),
         license_number=doc_in.license_number,
         is_verified=0
     )
     db.add(db_doctor)
+    # the INSERT hands back the id and every other column was set here, so no refresh SELECT
     db.commit()
-    db.refresh(db_doctor)
     return db_doctor
 
 
-def create_patient(db: Session, pat_in: schemas.PatientCreate):
-    """Create a new patient"""
+def create_patient(db: Session, pat_in: schemas.PatientCreate, hashed_password: str = None):
+    """Create a new patient; pass hashed_password when the hash was computed elsewhere (hashing pool)"""
     # Check if email already exists
     existing = db.query(models.Patient).filter(models.Patient.email == pat_in.email).first()
     if existing:
@@ -44,11 +140,10 @@ def create_patient(db: Session, pat_in: schemas.PatientCreate):
     db_patient = models.Patient(
         name=pat_in.name,
         email=pat_in.email,
-        hashed_password=get_password_hash(pat_in.password),
+        hashed_password=hashed_password or get_password_hash(pat_in.password),
     )
     db.add(db_patient)
     db.commit()
-    db.refresh(db_patient)
     return db_patient
 
 
@@ -58,107 +153,437 @@ def get_doctor(db: Session, doctor_id: int):
 
 
 def list_doctors(db: Session):
-    """List all doctors"""
-    return db.query(models.Doctor).filter(models.Doctor.is_verified == 1).all()
+    """List verified doctors (id, name, email)"""
+    return db.query(*DIRECTORY_COLUMNS).filter(models.Doctor.is_verified == 1).all()
+
+
+def get_verified_doctor_ids(db: Session):
+    return [r.id for r in db.query(models.Doctor.id).filter(models.Doctor.is_verified == 1).order_by(models.Doctor.id)]
+
+
+def list_pending_doctors(db: Session):
+    """List doctors awaiting verification"""
+    return db.query(*DOCTOR_COLUMNS).filter(models.Doctor.is_verified == 0).all()
+
+
+def set_doctor_verification(db: Session, doctor_id: int, is_verified: int) -> bool:
+    """Set a doctor's verification state (0 pending, 1 verified, 2 rejected) with one UPDATE; False if not found"""
+    result = db.execute(
+        update(models.Doctor)
+        .where(models.Doctor.id == doctor_id)
+        .values(is_verified=is_verified)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def get_appointment(db: Session, appointment_id: int):
+    """Get appointment by ID"""
+    return db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+
+
+def apply_transition(db: Session, appt: models.Appointment, action: str, **values):
+    """Move an appointment the handler has already loaded through TRANSITIONS[action], without re-reading it
+
+    The loaded status is checked against the table first (InvalidTransition,
+    no statement issued); then one `UPDATE ... WHERE id = :id AND status IN
+    (sources)` writes the target status and `values`. A terminal target
+    (cancel) instead moves the row to the archive under the same guard, so its
+    slot is free as soon as the transaction commits. A row count of 0 means
+    another request moved it in between: nothing is written and
+    AppointmentChanged is raised. The analytics rollups move the row from its
+    old (date, slot, status) to the new one. The entity is brought up to date
+    in memory, so the caller commits and returns it with no refresh SELECT.
+    """
+    transition = TRANSITIONS[action]
+    if appt.status not in transition.sources:
+        raise InvalidTransition(action)
+    values["status"] = transition.target
+    guard = [models.Appointment.id == appt.id, models.Appointment.status.in_(transition.sources)]
+    if transition.target in models.TERMINAL_STATUSES:
+        rowcount = archive.move_to_archive(db, guard, **values)
+    else:
+        rowcount = db.execute(
+            update(models.Appointment).where(*guard).values(**values).execution_options(synchronize_session=False)
+        ).rowcount
+    if rowcount != 1:
+        db.rollback()
+        raise AppointmentChanged()
+    if transition.target in models.TERMINAL_STATUSES:
+        record_released(db, appt.doctor_id, appt.date, appt.slot, appt.id)
+    record_counted(db, appt.doctor_id, appt.date, appt.slot, appt.status, appt.created_at, sign=-1)
+    for key, value in values.items():
+        set_committed_value(appt, key, value)
+    record_counted(db, appt.doctor_id, appt.date, appt.slot, appt.status, appt.created_at)
+
+
+def transition_appointment(db: Session, appt: models.Appointment, action: str):
+    """Apply a status-only transition (approve, cancel, reject, ...) to an already loaded appointment"""
+    apply_transition(db, appt, action)
+    record_slot_change(db, appt.doctor_id, appt.date)
+    db.commit()
+    return appt
 
 
 def get_appointments_for_doctor_date(db: Session, doctor_id: int, date):
-    """Get appointments for a doctor on a specific date"""
-    return db.query(models.Appointment).filter(
+    """(id, slot, patient_id) of a doctor's appointments on a date; an index-only scan of the covering index"""
+    return db.query(
+        models.Appointment.id,
+        models.Appointment.slot,
+        models.Appointment.patient_id,
+    ).filter(
         models.Appointment.doctor_id == doctor_id,
-        models.Appointment.date == date
+        models.Appointment.date == date,
+        models.Appointment.status.in_(models.ACTIVE_STATUSES),
+    ).all()
+
+
+def get_booked_slots_for_doctors_range(db: Session, doctor_ids, start_date, end_date):
+    """Get (doctor_id, date, slot) for every pending/booked appointment of the given doctors in a date range"""
+    return db.query(
+        models.Appointment.doctor_id,
+        models.Appointment.date,
+        models.Appointment.slot,
+    ).filter(
+        models.Appointment.doctor_id.in_(doctor_ids),
+        models.Appointment.date >= start_date,
+        models.Appointment.date <= end_date,
+        models.Appointment.status.in_(models.ACTIVE_STATUSES),
     ).all()
 
 
+def get_existing_doctor_ids(db: Session, doctor_ids):
+    """Return the subset of doctor_ids that exist"""
+    rows = db.query(models.Doctor.id).filter(models.Doctor.id.in_(doctor_ids)).all()
+    return {r.id for r in rows}
+
+
 def create_appointment(db: Session, appt_in: schemas.AppointmentCreate):
-    """Create a new appointment"""
-    # Check if slot is already booked
-    existing = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == appt_in.doctor_id,
-        models.Appointment.date == appt_in.date,
-        models.Appointment.slot == appt_in.slot
-    ).first()
-    if existing:
-        raise ValueError("Slot already booked")
-    
-    # Check if patient already has appointment at this slot
-    patient_existing = db.query(models.Appointment).filter(
-        models.Appointment.patient_id == appt_in.patient_id,
-        models.Appointment.date == appt_in.date,
-        models.Appointment.slot == appt_in.slot
-    ).first()
-    if patient_existing:
-        raise ValueError("Patient already has appointment at this slot")
-    
-    db_appointment = models.Appointment(
+    """Create a new appointment with a single INSERT
+
+    There is no check-then-insert: the uix_doctor_date_slot / uix_patient_date_slot
+    constraints decide concurrent bookings, and the loser gets a BookingConflict.
+    The slot must exist in the doctor's schedule for that date (ValueError otherwise).
+    """
+    schedules.check_slot(db, appt_in.doctor_id, appt_in.date, appt_in.slot)
+    values = dict(
         doctor_id=appt_in.doctor_id,
         patient_id=appt_in.patient_id,
         date=appt_in.date,
         slot=appt_in.slot,
-        status="PENDING"
+        status="PENDING",
+        is_rescheduled=0,
+        created_at=datetime.datetime.utcnow(),
     )
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
-    return db_appointment
+    try:
+        # the new id comes back from the INSERT itself (RETURNING on Postgres, lastrowid on SQLite)
+        result = db.execute(insert(models.Appointment).values(**values))
+        appointment_id = result.inserted_primary_key[0]
+        record_slot_change(db, appt_in.doctor_id, appt_in.date)
+        record_booked(db, appt_in.doctor_id, appt_in.date, appt_in.slot, appointment_id, appt_in.patient_id)
+        record_counted(db, appt_in.doctor_id, appt_in.date, appt_in.slot, "PENDING", values["created_at"])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise booking_conflict(e) or e
+    return models.Appointment(id=appointment_id, **values)
 
 
-def cancel_appointment(db: Session, appointment_id: int):
-    """Cancel an appointment"""
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
-    if not appt:
-        raise ValueError("Appointment not found")
-    
-    appt.status = "CANCELLED"
-    db.commit()
-    db.refresh(appt)
-    return appt
+UNOFFERED_SLOT = "Slot not offered on this date"
 
 
-def get_patient_appointments(db: Session, patient_id: int):
-    """Get all appointments for a patient"""
-    return db.query(models.Appointment).filter(
-        models.Appointment.patient_id == patient_id
-    ).all()
+def bulk_create_appointments(db: Session, doctor_id: int, patient_id: int, visits):
+    """Book a series of (date, slot) visits with one doctor in one transaction
 
+    One SELECT finds every visit that would collide with an existing doctor or
+    patient booking, the rest go in with a single executemany INSERT. Visits the
+    doctor's schedule does not offer are reported, not booked. Returns one
+    (date, slot, appointment_id, error) tuple per distinct visit, in input order.
+    """
+    pairs = list(dict.fromkeys((v.date, v.slot) for v in visits))
+    schedule = schedules.cache.get(db, doctor_id)
+    offered = [p for p in pairs if schedule.offers(*p)]
+    taken = {}
+    if offered:
+        for row in db.query(
+            models.Appointment.doctor_id, models.Appointment.date, models.Appointment.slot
+        ).filter(
+            or_(models.Appointment.doctor_id == doctor_id, models.Appointment.patient_id == patient_id),
+            tuple_(models.Appointment.date, models.Appointment.slot).in_(offered),
+        ):
+            constraint = "uix_doctor_date_slot" if row.doctor_id == doctor_id else "uix_patient_date_slot"
+            # a taken doctor slot is the more useful message when both apply
+            if taken.get((row.date, row.slot)) != "uix_doctor_date_slot":
+                taken[(row.date, row.slot)] = constraint
 
-def reject_appointment(db: Session, appointment_id: int):
-    """Reject an appointment"""
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
-    if not appt:
-        raise ValueError("Appointment not found")
-    
-    appt.status = "REJECTED"
-    db.commit()
-    db.refresh(appt)
-    return appt
+    free = [p for p in offered if p not in taken]
+    ids = {}
+    if free:
+        now = datetime.datetime.utcnow()
+        try:
+            db.execute(insert(models.Appointment), [
+                dict(doctor_id=doctor_id, patient_id=patient_id, date=d, slot=slot,
+                     status="PENDING", is_rescheduled=0, created_at=now)
+                for d, slot in free
+            ])
+            for d, slot in free:
+                record_slot_change(db, doctor_id, d)
+                record_counted(db, doctor_id, d, slot, "PENDING", now)
+            ids = {
+                (r.date, r.slot): r.id
+                for r in db.query(models.Appointment.id, models.Appointment.date, models.Appointment.slot).filter(
+                    models.Appointment.doctor_id == doctor_id,
+                    tuple_(models.Appointment.date, models.Appointment.slot).in_(free),
+                )
+            }
+            for (d, slot), appointment_id in ids.items():
+                record_booked(db, doctor_id, d, slot, appointment_id, patient_id)
+            db.commit()
+        except IntegrityError as e:
+            # lost a race after the conflict check; nothing was written
+            db.rollback()
+            raise booking_conflict(e) or e
 
+    results = []
+    for pair in pairs:
+        if pair in taken:
+            results.append((pair[0], pair[1], None, BookingConflict.MESSAGES[taken[pair]]))
+        elif pair not in ids:
+            results.append((pair[0], pair[1], None, UNOFFERED_SLOT))
+        else:
+            results.append((pair[0], pair[1], ids[pair], None))
+    return results
 
-def reschedule_appointment(db: Session, appointment_id: int, new_date, new_slot: int):
-    """Reschedule an appointment - changes to new date/slot and status to PENDING"""
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
-    if not appt:
-        raise ValueError("Appointment not found")
-    
-    # Check if new slot is already booked
-    existing = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == appt.doctor_id,
-        models.Appointment.date == new_date,
-        models.Appointment.slot == new_slot,
-        models.Appointment.id != appointment_id
-    ).first()
-    if existing:
-        raise ValueError("New slot already booked")
-    
-    appt.date = new_date
-    appt.slot = new_slot
-    appt.status = "PENDING"
-    appt.is_rescheduled = 1
+
+def bulk_transition_appointments(db: Session, doctor_id: int, appointment_ids, action: str):
+    """Apply TRANSITIONS[action] to every listed appointment owned by doctor_id with one UPDATE
+
+    Ownership and current status are resolved for all ids with one SELECT.
+    Returns {id: outcome} with outcome "updated", "not_found", "forbidden" or
+    "invalid" (status not in the transition's sources). A terminal target
+    moves the rows to the archive instead, like apply_transition. When the
+    write does not hit exactly the rows the SELECT found eligible, another
+    request got in between: it is rolled back and AppointmentChanged is raised.
+    """
+    transition = TRANSITIONS[action]
+    terminal = transition.target in models.TERMINAL_STATUSES
+    ids = list(dict.fromkeys(appointment_ids))
+    rows = (
+        db.query(models.Appointment.id, models.Appointment.doctor_id, models.Appointment.date,
+                 models.Appointment.slot, models.Appointment.status, models.Appointment.created_at)
+        .filter(models.Appointment.id.in_(ids))
+        .all()
+    )
+    outcomes = {i: "not_found" for i in ids}
+    eligible = []
+    for r in rows:
+        if r.doctor_id != doctor_id:
+            outcomes[r.id] = "forbidden"
+        elif r.status not in transition.sources:
+            outcomes[r.id] = "invalid"
+        else:
+            outcomes[r.id] = "updated"
+            eligible.append(r.id)
+            record_slot_change(db, r.doctor_id, r.date)
+            if terminal:
+                record_released(db, r.doctor_id, r.date, r.slot, r.id)
+            record_counted(db, r.doctor_id, r.date, r.slot, r.status, r.created_at, sign=-1)
+            record_counted(db, r.doctor_id, r.date, r.slot, transition.target, r.created_at)
+    if eligible:
+        guard = [
+            models.Appointment.id.in_(eligible),
+            models.Appointment.doctor_id == doctor_id,
+            models.Appointment.status.in_(transition.sources),
+        ]
+        if terminal:
+            rowcount = archive.move_to_archive(db, guard, status=transition.target)
+        else:
+            rowcount = db.execute(
+                update(models.Appointment).where(*guard).values(status=transition.target)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        if rowcount != len(eligible):
+            db.rollback()
+            raise AppointmentChanged()
+        db.commit()
+    return outcomes
+
+
+def encode_cursor(appt) -> str:
+    """Opaque keyset cursor for the (date, slot, id) position of an appointment"""
+    raw = f"{appt.date.isoformat()}:{appt.slot}:{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError on a malformed token"""
+    try:
+        day, slot, appt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return datetime.date.fromisoformat(day), int(slot), int(appt_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_appointments_page(
+    db: Session,
+    doctor_id: int = None,
+    patient_id: int = None,
+    status: str = None,
+    date_from=None,
+    date_to=None,
+    limit: int = 50,
+    cursor: str = None,
+    archived: bool = False,
+):
+    """One keyset page of appointments ordered by (date, slot, id); returns (items, next_cursor)
+
+    archived=True pages through appointments_archive (the history feeds) instead of the live table.
+    """
+    model = models.AppointmentArchive if archived else models.Appointment
+    query = db.query(*(ARCHIVE_COLUMNS if archived else APPOINTMENT_COLUMNS))
+    if doctor_id is not None:
+        query = query.filter(model.doctor_id == doctor_id)
+    if patient_id is not None:
+        query = query.filter(model.patient_id == patient_id)
+    if status is not None:
+        query = query.filter(model.status == status)
+    if date_from is not None:
+        query = query.filter(model.date >= date_from)
+    if date_to is not None:
+        query = query.filter(model.date <= date_to)
+    if cursor is not None:
+        query = query.filter(tuple_(model.date, model.slot, model.id) > tuple_(*decode_cursor(cursor)))
+
+    # one extra row tells us whether another page exists
+    rows = query.order_by(model.date, model.slot, model.id).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def count_appointments_by_day(db: Session, doctor_id: int, start_date, end_date) -> Dict:
+    """{date: {status: count}} for one doctor over a date range, live and archived, from the daily rollup
+
+    appointment_daily_stats already holds one counter per (doctor, day, status)
+    (app/analytics.py), so this is a primary key range scan of at most four rows
+    per day, however many appointments the doctor has.
+    """
+    stats = models.AppointmentDailyStats
+    counts = {}
+    for day, status, count in db.execute(
+        select(stats.date, stats.status, stats.appointments).where(
+            stats.doctor_id == doctor_id, stats.date >= start_date, stats.date <= end_date, stats.appointments > 0
+        )
+    ):
+        counts.setdefault(day, {})[status] = count
+    return counts
+
+
+def reschedule_appointment(db: Session, appt: models.Appointment, new_date, new_slot: int):
+    """Reschedule an already loaded appointment - changes to new date/slot and status to PENDING
+
+    The UPDATE is arbitrated by the unique constraints (BookingConflict), not by a prior SELECT.
+    """
+    schedules.check_slot(db, appt.doctor_id, new_date, new_slot)
+    old_date, old_slot = appt.date, appt.slot
+    try:
+        apply_transition(db, appt, "reschedule", date=new_date, slot=new_slot, is_rescheduled=1)
+    except IntegrityError as e:
+        db.rollback()
+        raise booking_conflict(e) or e
+
+    record_slot_change(db, appt.doctor_id, old_date)
+    record_released(db, appt.doctor_id, old_date, old_slot, appt.id)
+    record_slot_change(db, appt.doctor_id, new_date)
+    record_booked(db, appt.doctor_id, new_date, new_slot, appt.id, appt.patient_id)
     db.commit()
-    db.refresh(appt)
     return appt
 
 
 def get_all_doctors_with_status(db: Session):
     """Get all doctors with their verification status"""
-    return db.query(models.Doctor).all()
+    return db.query(*DOCTOR_COLUMNS).all()
+
+
+def check_schedule_change(db: Session, doctor_id: int, before: schedules.WeeklySchedule, day=None):
+    """Roll back and raise ScheduleConflict if the uncommitted schedule change moves a held slot
+
+    Compares the (start, end) of every pending/booked appointment from today on
+    (or only on `day`) under the schedule before the change and the one now in
+    the transaction.
+    """
+    after = schedules.load_schedules(db, [doctor_id])[doctor_id]
+    query = db.query(models.Appointment.id, models.Appointment.date, models.Appointment.slot).filter(
+        models.Appointment.doctor_id == doctor_id,
+        models.Appointment.status.in_(models.ACTIVE_STATUSES),
+    )
+    if day is not None:
+        query = query.filter(models.Appointment.date == day)
+    else:
+        query = query.filter(models.Appointment.date >= datetime.date.today())
+    moved = [
+        r.id for r in query.order_by(models.Appointment.date, models.Appointment.slot)
+        if before.slot_times(r.date, r.slot) != after.slot_times(r.date, r.slot)
+    ]
+    if moved:
+        db.rollback()
+        raise ScheduleConflict(moved)
+
+
+def set_weekly_schedule(db: Session, doctor_id: int, days):
+    """Replace the doctor's weekly template (working hours and breaks per weekday)
+
+    An empty list removes the template, which puts the doctor back on the legacy day.
+    Raises ScheduleConflict, changing nothing, if an upcoming appointment's slot would move.
+    """
+    before = schedules.load_schedules(db, [doctor_id])[doctor_id]
+    db.query(models.ScheduleBreak).filter(models.ScheduleBreak.doctor_id == doctor_id).delete(synchronize_session=False)
+    db.query(models.DoctorSchedule).filter(models.DoctorSchedule.doctor_id == doctor_id).delete(synchronize_session=False)
+    if days:
+        db.execute(insert(models.DoctorSchedule), [
+            dict(doctor_id=doctor_id, weekday=d.weekday, start_time=d.start, end_time=d.end,
+                 slot_minutes=d.slot_minutes)
+            for d in days
+        ])
+    breaks = [
+        dict(doctor_id=doctor_id, weekday=d.weekday, start_time=b.start, end_time=b.end)
+        for d in days for b in d.breaks
+    ]
+    if breaks:
+        db.execute(insert(models.ScheduleBreak), breaks)
+    check_schedule_change(db, doctor_id, before)
+    db.commit()
+
+
+def set_schedule_exception(db: Session, doctor_id: int, exc_in: schemas.ScheduleExceptionIn):
+    """Create or replace the exception for one date; ScheduleConflict if it moves a held slot"""
+    before = schedules.load_schedules(db, [doctor_id])[doctor_id]
+    db.query(models.ScheduleException).filter(
+        models.ScheduleException.doctor_id == doctor_id,
+        models.ScheduleException.date == exc_in.date,
+    ).delete(synchronize_session=False)
+    db.add(models.ScheduleException(
+        doctor_id=doctor_id,
+        date=exc_in.date,
+        is_closed=1 if exc_in.closed else 0,
+        start_time=exc_in.start,
+        end_time=exc_in.end,
+        slot_minutes=exc_in.slot_minutes,
+    ))
+    db.flush()
+    check_schedule_change(db, doctor_id, before, exc_in.date)
+    db.commit()
+
+
+def delete_schedule_exception(db: Session, doctor_id: int, day) -> bool:
+    """Put the date back on the weekly template; ScheduleConflict if that moves a held slot"""
+    before = schedules.load_schedules(db, [doctor_id])[doctor_id]
+    deleted = db.query(models.ScheduleException).filter(
+        models.ScheduleException.doctor_id == doctor_id,
+        models.ScheduleException.date == day,
+    ).delete(synchronize_session=False)
+    if deleted:
+        check_schedule_change(db, doctor_id, before, day)
+    db.commit()
+    return deleted > 0
@@ -0,0 +1,53 @@
+"""Async counterparts of the crud functions for AsyncSession-based handlers.
+
+Each function runs its sync implementation from crud.py through
+AsyncSession.run_sync, so the query logic lives in exactly one place while the
+I/O goes through the async driver (aiosqlite / asyncpg) without occupying a
+threadpool worker.
+"""
+import functools
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, database, schedules
+
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+def _async_write(fn):
+    """Like _async, for functions that write: queued behind database.write_lock()"""
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        async with database.write_lock():
+            return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+create_doctor = _async_write(crud.create_doctor)
+create_patient = _async_write(crud.create_patient)
+get_doctor = _async(crud.get_doctor)
+list_doctors = _async(crud.list_doctors)
+get_verified_doctor_ids = _async(crud.get_verified_doctor_ids)
+list_pending_doctors = _async(crud.list_pending_doctors)
+set_doctor_verification = _async_write(crud.set_doctor_verification)
+get_all_doctors_with_status = _async(crud.get_all_doctors_with_status)
+get_existing_doctor_ids = _async(crud.get_existing_doctor_ids)
+
+get_appointment = _async(crud.get_appointment)
+transition_appointment = _async_write(crud.transition_appointment)
+get_appointments_for_doctor_date = _async(crud.get_appointments_for_doctor_date)
+get_booked_slots_for_doctors_range = _async(crud.get_booked_slots_for_doctors_range)
+list_appointments_page = _async(crud.list_appointments_page)
+count_appointments_by_day = _async(crud.count_appointments_by_day)
+create_appointment = _async_write(crud.create_appointment)
+bulk_create_appointments = _async_write(crud.bulk_create_appointments)
+bulk_transition_appointments = _async_write(crud.bulk_transition_appointments)
+reschedule_appointment = _async_write(crud.reschedule_appointment)
+
+get_schedules = _async(schedules.cache.get_many)
+set_weekly_schedule = _async_write(crud.set_weekly_schedule)
+set_schedule_exception = _async_write(crud.set_schedule_exception)
+delete_schedule_exception = _async_write(crud.delete_schedule_exception)
@@ -1,14 +1,109 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextlib
+import weakref
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from . import config, instrumentation
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./appointments.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL to its asyncio driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return _is_sqlite(url) and (url.rstrip("/").endswith(":memory:") or url.split("://", 1)[-1] in ("", "/"))
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool and driver settings for the configured database"""
+    if _is_sqlite_memory(url):
+        # one shared connection, otherwise every checkout would see a new empty database
+        return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+    options = {
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    }
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        # server databases drop idle connections; SQLite files do not
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = config.DB_POOL_RECYCLE
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL is durable across app crashes in WAL mode
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    # wait for the write lock instead of failing immediately with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    # negative cache_size is in KiB
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def apply_profile(sync_engine, url: str):
+    """Install the connection-time tuning for the configured DB_PROFILE"""
+    if config.DB_PROFILE == "production" and _is_sqlite(url) and not _is_sqlite_memory(url):
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+
+# sync engine: startup DDL/migrations and command line scripts (seed.py, migrate.py, ...)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+apply_profile(engine, SQLALCHEMY_DATABASE_URL)
+instrumentation.instrument_engine(engine)
 #it works on individual sessions it completes request and then commit changes
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async engine: request handlers, so in-flight requests are not capped by the threadpool
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True))
+apply_profile(async_engine.sync_engine, SQLALCHEMY_DATABASE_URL)
+instrumentation.instrument_engine(async_engine.sync_engine)
+# objects stay readable after commit without another round trip (lazy loads cannot happen outside the greenlet)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False
+)
+
+# SQLite has one writer at a time and its busy handler is not fair: a connection that
+# keeps committing in a tight async loop re-takes the lock while the others sleep in
+# backoff until busy_timeout expires. Queueing writers on an asyncio lock first keeps
+# that wait FIFO inside the process (other processes still go through busy_timeout).
+SERIALIZE_WRITES = _is_sqlite(SQLALCHEMY_DATABASE_URL)
+_write_locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+
+
+def write_lock():
+    """The write queue of the running event loop, or a no-op context when writes need no queue"""
+    if not SERIALIZE_WRITES:
+        return contextlib.nullcontext()
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+
 Base = declarative_base()
 
 
@@ -18,3 +113,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
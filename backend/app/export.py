@@ -0,0 +1,88 @@
+"""Streaming appointment export (CSV / NDJSON, optionally gzipped) for the admin endpoint.
+
+Rows come from AsyncSession.stream with yield_per, so the driver hands them
+over EXPORT_BATCH_ROWS at a time and each batch is encoded and sent before
+the next is fetched: memory stays flat however many rows match. The export
+opens its own session because it outlives the request handler, and reads in
+primary key order so the database never has to sort the full result.
+"""
+import csv
+import datetime
+import io
+import zlib
+from typing import AsyncIterator, Optional
+import orjson
+from sqlalchemy import null, select
+from . import database, models
+
+EXPORT_BATCH_ROWS = 1000
+FIELDS = ("id", "doctor_id", "patient_id", "date", "slot", "status", "is_rescheduled", "created_at", "archived_at")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SOURCES = ("all", "live", "archive")
+
+
+def export_query(model, doctor_id=None, status=None, date_from=None, date_to=None):
+    archived_at = model.archived_at if model is models.AppointmentArchive else null().label("archived_at")
+    query = select(*(getattr(model, name) for name in FIELDS[:-1]), archived_at).order_by(model.id)
+    if doctor_id is not None:
+        query = query.where(model.doctor_id == doctor_id)
+    if status is not None:
+        query = query.where(model.status == status)
+    if date_from is not None:
+        query = query.where(model.date >= date_from)
+    if date_to is not None:
+        query = query.where(model.date <= date_to)
+    return query.execution_options(yield_per=EXPORT_BATCH_ROWS)
+
+
+async def rows(source: str, **filters) -> AsyncIterator[list]:
+    """Batches of result rows: live appointments first, then archived ones (per `source`)"""
+    models_for_source = {
+        "all": (models.Appointment, models.AppointmentArchive),
+        "live": (models.Appointment,),
+        "archive": (models.AppointmentArchive,),
+    }[source]
+    async with database.AsyncSessionLocal() as db:
+        for model in models_for_source:
+            result = await db.stream(export_query(model, **filters))
+            async for batch in result.partitions():
+                yield batch
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+async def encode(batches: AsyncIterator[list], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        async for batch in batches:
+            writer.writerows([_csv_value(v) for v in row] for row in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        async for batch in batches:
+            yield b"".join(orjson.dumps(dict(zip(FIELDS, row))) + b"\n" for row in batch)
+
+
+async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(fmt: str, gzip: bool, source: str = "all", doctor_id: Optional[int] = None, status: Optional[str] = None,
+           date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> AsyncIterator[bytes]:
+    """The response body of an export, ready for StreamingResponse"""
+    body = encode(rows(source, doctor_id=doctor_id, status=status, date_from=date_from, date_to=date_to), fmt)
+    return gzipped(body) if gzip else body
@@ -0,0 +1,101 @@
+"""Password hashing on a bounded process pool.
+
+argon2 is deliberately CPU- and memory-hard; running it inline in request
+handlers ties up the server's worker threads during login bursts. Hashes and
+verifications are sent to a dedicated ProcessPoolExecutor instead (no GIL
+contention), and once HASH_WORKERS + HASH_MAX_QUEUE jobs are in flight new
+requests are refused with HashingBusy, which the API maps to 429.
+
+The workers are spawned, not forked: a fork from inside the running server
+would copy its event loop, thread locks and open database connections into
+every worker.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from . import config, metrics
+
+HASH_WORKERS = config.HASH_WORKERS
+HASH_MAX_QUEUE = config.HASH_MAX_QUEUE
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+hash_latency = metrics.histogram(
+    "password_hash_seconds", "Time from submission to result for password hash/verify jobs"
+)
+hash_queue_wait = metrics.histogram(
+    "password_hash_queue_wait_seconds", "Time password hash/verify jobs spent waiting for a worker"
+)
+hash_rejected = metrics.counter(
+    "password_hash_rejected_total", "Password hash/verify jobs refused because the queue was full"
+)
+
+_executor = None
+_in_flight = 0
+_dummy_hash = None
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; the caller should retry later"""
+
+
+def _hash(password: str):
+    return time.time(), pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str):
+    return time.time(), pwd_context.verify(plain_password, hashed_password)
+
+
+def hash_sync(password: str) -> str:
+    """Plain argon2 hash; the picklable entry point for pools outside the request path (bulk import)"""
+    return pwd_context.hash(password)
+
+
+def dummy_hash() -> str:
+    """A real argon2 hash of a throwaway secret, for constant-cost verification of unknown accounts"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = pwd_context.hash(os.urandom(16).hex())
+    return _dummy_hash
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _submit(fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_WORKERS + HASH_MAX_QUEUE:
+        hash_rejected.inc()
+        raise HashingBusy("Too many concurrent password operations, retry shortly")
+    _in_flight += 1
+    submitted = time.time()
+    try:
+        started, result = await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+    hash_queue_wait.observe(max(started - submitted, 0.0))
+    hash_latency.observe(time.time() - submitted)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _submit(_verify, plain_password, hashed_password)
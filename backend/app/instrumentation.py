@@ -0,0 +1,141 @@
+"""Per-request latency, query count and DB time.
+
+RequestTimingMiddleware opens a RequestStats for every HTTP request in a
+context variable; cursor-execute listeners on both engines add each statement
+to the stats of the request that issued it. The async engine runs the sync
+crud functions through AsyncSession.run_sync, whose greenlet inherits the
+caller's context, so statements executed through aiosqlite are attributed to
+the right request too. Statements run outside a request (startup, scripts)
+are timed but belong to no request.
+
+Totals go to labelled histograms on /metrics (the route label is the path
+template, e.g. /appointments/{appointment_id}/approve, so cardinality stays
+bounded). SERVER_TIMING=1 adds a Server-Timing header to every response and
+SLOW_QUERY_MS > 0 logs each statement that takes at least that long.
+"""
+import contextvars
+import logging
+import time
+from typing import Optional
+from sqlalchemy import event
+from . import config, metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+request_latency = metrics.histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte",
+    labelnames=("method", "route"),
+)
+request_queries = metrics.histogram(
+    "http_request_db_queries", "SQL statements executed per request", QUERY_COUNT_BUCKETS,
+    labelnames=("method", "route"),
+)
+request_db_time = metrics.histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", labelnames=("method", "route"),
+)
+requests_total = metrics.counter(
+    "http_requests_total", "Requests by route and response status", labelnames=("method", "route", "status"),
+)
+query_latency = metrics.histogram("db_query_duration_seconds", "Time to execute one SQL statement")
+slow_queries = metrics.counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS")
+
+
+class RequestStats:
+    __slots__ = ("request", "queries", "db_seconds")
+
+    def __init__(self, request: str):
+        self.request = request  # "METHOD /path", for the slow-query log
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    query_latency.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if config.SLOW_QUERY_MS and elapsed * 1000 >= config.SLOW_QUERY_MS:
+        slow_queries.inc()
+        # parameters are left out: they can carry password hashes and patient details
+        logger.warning(
+            "slow query %.1f ms%s: %s", elapsed * 1000,
+            f" in {stats.request}" if stats is not None else "", " ".join(statement.split()),
+        )
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute; drop its start time
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(sync_engine):
+    """Time every statement the engine executes (pass async_engine.sync_engine for the async engine)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware recording latency, query count and DB time per route"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None  # endpoint -> path template, built on first use
+
+    def route_for(self, scope) -> str:
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path for route in scope["app"].routes
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(f"{scope['method']} {scope['path']}")
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if config.SERVER_TIMING:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    value = (
+                        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries", '
+                        f"app;dur={total_ms:.2f}"
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = self.route_for(scope)
+            method = scope["method"]
+            request_latency.observe(time.perf_counter() - started, method=method, route=route)
+            request_queries.observe(stats.queries, method=method, route=route)
+            request_db_time.observe(stats.db_seconds, method=method, route=route)
+            requests_total.inc(method=method, route=route, status=status)
@@ -1,20 +1,52 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from . import database, models, schemas, crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, models, schemas, crud_async, migrations, hashing, metrics, config, cache, pubsub, occupancy
+from . import schedules, instrumentation, archive, export, analytics
 from .auth import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
     get_current_user,
+    principal_cache,
 )
+import asyncio
 import datetime
+import json
+import orjson
+from typing import List, Optional
 from sqlalchemy.exc import IntegrityError
+from .crud import TRANSITIONS, AppointmentChanged, BookingConflict, InvalidTransition, ScheduleConflict
 from fastapi.middleware.cors import CORSMiddleware
 
 
 
 
-app = FastAPI(title="Appointment Backend")
+# orjson renders every response; list endpoints that return projected rows hand
+# them to ORJSONResponse directly instead of going through response_model validation
+app = FastAPI(title="Appointment Backend", default_response_class=ORJSONResponse)
+
+# upper bounds for a single availability grid / free-slots request
+MAX_GRID_DOCTORS = 50
+MAX_GRID_DAYS = 31
+# next-available search: days fetched per range query and the furthest it looks ahead
+SEARCH_CHUNK_DAYS = 14
+SEARCH_HORIZON_DAYS = 90
+MAX_SEARCH_RESULTS = 50
+# page size bounds for the appointment feeds
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+APPOINTMENT_STATUSES = ("PENDING", "BOOKED", "CANCELLED", "REJECTED")
+# doctor summary: longest range per request and the ways it can be bucketed
+MAX_SUMMARY_DAYS = 366
+SUMMARY_GROUPS = ("day", "week")
+
+# slot change streams
+MAX_STREAM_KEYS = 62
+STREAM_HEARTBEAT_SECONDS = 15
+
+# serialized GET /doctors body; only admin verify/reject changes it
+doctor_directory = cache.ResponseCache(config.DOCTOR_DIRECTORY_TTL_SECONDS)
 
 #to integrate with frontend
 app.add_middleware(
@@ -24,46 +56,96 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# per-route latency / query count / DB time on /metrics; added last so it also times CORS handling
+app.add_middleware(instrumentation.RequestTimingMiddleware)
 
 #database initialization(connection to the database and creating tables)
 @app.on_event("startup")
 def startup():
     models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    if config.OCCUPANCY_INDEX:
+        with database.SessionLocal() as db:
+            occupancy.index.warm(db)
+    # pay for the unknown-email dummy hash and the hashing pool up front, not on the first login
+    hashing.dummy_hash()
+    hashing.get_executor()
+
+
+# background archiving of past / cancelled appointments (app/archive.py)
+archive_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_archiving():
+    global archive_task
+    if config.ARCHIVE_INTERVAL_SECONDS > 0:
+        archive_task = asyncio.create_task(archive.run_periodically(config.ARCHIVE_INTERVAL_SECONDS))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if archive_task is not None:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
+    hashing.shutdown()
+    # aiosqlite keeps a non-daemon thread per pooled connection; close them so the process can exit
+    await database.async_engine.dispose()
+
 
+def hashing_busy(e: hashing.HashingBusy):
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
 
-def get_db():
-    yield from database.get_db()
+
+async def get_db():
+    async for db in database.get_async_db():
+        yield db
 
 
 @app.post("/doctors", response_model=schemas.DoctorOut)
-def create_doctor(doc_in: schemas.DoctorCreate, db: Session = Depends(get_db)):  #depends work as middleware
+async def create_doctor(doc_in: schemas.DoctorCreate, db: AsyncSession = Depends(get_db)):  #depends work as middleware
     try:
-        doc = crud.create_doctor(db, doc_in)
+        hashed_password = await hashing.hash_password(doc_in.password)
+        doc = await crud_async.create_doctor(db, doc_in, hashed_password)
         return doc
+    except hashing.HashingBusy as e:
+        raise hashing_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/patients", response_model=schemas.PatientOut)
-def create_patient(pat_in: schemas.PatientCreate, db: Session = Depends(get_db)):
+async def create_patient(pat_in: schemas.PatientCreate, db: AsyncSession = Depends(get_db)):
     try:
-        pat = crud.create_patient(db, pat_in)
+        hashed_password = await hashing.hash_password(pat_in.password)
+        pat = await crud_async.create_patient(db, pat_in, hashed_password)
         return pat
+    except hashing.HashingBusy as e:
+        raise hashing_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     # form_data.username should be the email
-    user = authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
+    except hashing.HashingBusy as e:
+        raise hashing_busy(e)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     access_token = create_access_token(
         data={
         "sub": user.email,
         "role": user.role,
-        "id": user.id,   
+        "id": user.id,
+        # authorization claims for AUTH_MODE=stateless
+        "is_verified": getattr(user, 'is_verified', 1),
+        "name": getattr(user, 'name', None),
         }
     )
 
@@ -76,39 +158,362 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
 
 
-@app.get("/doctors")
-def list_doctors(db: Session = Depends(get_db)):
-    docs = crud.list_doctors(db)
-    return [{"id": d.id, "name": d.name, "email": d.email} for d in docs]
+@app.get("/doctors", response_model=List[schemas.DirectoryDoctor])
+async def list_doctors(request: Request, db: AsyncSession = Depends(get_db)):
+    cached = doctor_directory.get()
+    if cached is None:
+        version = doctor_directory.version
+        docs = await crud_async.list_doctors(db)
+        body = orjson.dumps([d._asdict() for d in docs])
+        cached = doctor_directory.put(version, body)
+    body, etag = cached
+
+    # clients must revalidate, which costs a 304 and no query while the cache is warm
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
-@app.get("/doctors/{doctor_id}/availability")
-def doctor_availability(doctor_id: int, date: str, db: Session = Depends(get_db)):
+@app.get("/doctors/{doctor_id}/availability", response_model=schemas.DoctorAvailability)
+async def doctor_availability(doctor_id: int, date: str, db: AsyncSession = Depends(get_db)):
     try:
         date_obj = datetime.date.fromisoformat(date)
     except ValueError:
         raise HTTPException(status_code=400, detail="invalid date format; use YYYY-MM-DD")
 
-    doctor = crud.get_doctor(db, doctor_id)
-    if not doctor:
-        raise HTTPException(status_code=404, detail="doctor not found")
-
-    appts = crud.get_appointments_for_doctor_date(db, doctor_id, date_obj)
-    booked = {a.slot: a for a in appts}
+    if occupancy.index.covers(date_obj):
+        # served from memory; only a doctor the index has not seen yet costs a query
+        if not occupancy.index.has_doctor(doctor_id):
+            if not await crud_async.get_doctor(db, doctor_id):
+                raise HTTPException(status_code=404, detail="doctor not found")
+            occupancy.index.add_doctor(doctor_id)
+        booked = occupancy.index.holders(doctor_id, date_obj)
+    else:
+        doctor = await crud_async.get_doctor(db, doctor_id)
+        if not doctor:
+            raise HTTPException(status_code=404, detail="doctor not found")
+
+        appts = await crud_async.get_appointments_for_doctor_date(db, doctor_id, date_obj)
+        booked = {a.slot: (a.id, a.patient_id) for a in appts}
+
+    schedule = (await crud_async.get_schedules(db, [doctor_id]))[doctor_id]
     slots = []
-    for s in range(1, 5):
+    for s, start, end in schedule.slots(date_obj):
         if s in booked:
-            a = booked[s]
-            slots.append({"slot": s, "available": False, "appointment_id": a.id, "patient_id": a.patient_id})
+            appointment_id, patient_id = booked[s]
+            slots.append({"slot": s, "start": start, "end": end, "available": False,
+                          "appointment_id": appointment_id, "patient_id": patient_id})
         else:
-            slots.append({"slot": s, "available": True, "appointment_id": None, "patient_id": None})
-    return {"date": date_obj.isoformat(), "doctor_id": doctor_id, "slots": slots}
+            slots.append({"slot": s, "start": start, "end": end, "available": True,
+                          "appointment_id": None, "patient_id": None})
+    return {"date": date_obj, "doctor_id": doctor_id, "slots": slots}
+
+
+def check_date_range(start: datetime.date, end: datetime.date, max_days: int = MAX_GRID_DAYS) -> int:
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    days = (end - start).days + 1
+    if days > max_days:
+        raise HTTPException(status_code=400, detail=f"date range is limited to {max_days} days")
+    return days
+
+
+async def ensure_doctors_exist(db: AsyncSession, doctor_ids):
+    unknown = [d for d in doctor_ids if not occupancy.index.has_doctor(d)]
+    if unknown:
+        missing = set(unknown) - await crud_async.get_existing_doctor_ids(db, unknown)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"doctor not found: {sorted(missing)}")
+
+
+async def booked_masks(db: AsyncSession, doctor_ids, start: datetime.date, days: int):
+    """{doctor_id: [bitmask of taken slots per day]} from the occupancy index or one range query"""
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    if occupancy.index.covers(start):
+        return {doctor_id: [occupancy.index.mask(doctor_id, d) for d in dates] for doctor_id in doctor_ids}
+    masks = {doctor_id: [0] * days for doctor_id in doctor_ids}
+    for doctor_id, day, slot in await crud_async.get_booked_slots_for_doctors_range(db, doctor_ids, start, dates[-1]):
+        masks[doctor_id][(day - start).days] |= 1 << (slot - 1)
+    return masks
+
+
+@app.get("/doctors/{doctor_id}/free-slots", response_model=schemas.FreeSlots)
+async def doctor_free_slots(
+    doctor_id: int,
+    start: datetime.date = Query(...),
+    end: datetime.date = Query(...),
+    db: AsyncSession = Depends(get_db),
+):
+    """Every free slot of one doctor over a date range (up to a month), with its start/end time"""
+    days = check_date_range(start, end)
+    await ensure_doctors_exist(db, [doctor_id])
+    booked = (await booked_masks(db, [doctor_id], start, days))[doctor_id]
+    schedule = (await crud_async.get_schedules(db, [doctor_id]))[doctor_id]
+
+    free_days = []
+    for i, taken in enumerate(booked):
+        day = start + datetime.timedelta(days=i)
+        free = [
+            {"slot": s, "start": slot_start, "end": slot_end}
+            for s, slot_start, slot_end in schedule.slots(day)
+            if not taken >> (s - 1) & 1
+        ]
+        free_days.append({"date": day, "slots": free})
+    # a month of 15-minute slots is over a thousand entries: skip response_model
+    # validation / jsonable_encoder, which would cost ~40x the computation
+    return ORJSONResponse({"doctor_id": doctor_id, "start": start, "end": end, "days": free_days})
+
+
+def hex_masks(masks):
+    # a day can have up to schemas.MAX_SLOTS_PER_DAY bits: more than orjson (64) or a JavaScript number (53) carries
+    return [format(mask, "x") for mask in masks]
+
+
+@app.get("/doctors/availability-grid", response_model=schemas.AvailabilityGrid)
+async def doctor_availability_grid(
+    doctor_ids: List[int] = Query(...),
+    start: datetime.date = Query(...),
+    end: datetime.date = Query(...),
+    db: AsyncSession = Depends(get_db),
+):
+    doctor_ids = list(dict.fromkeys(doctor_ids))
+    if len(doctor_ids) > MAX_GRID_DOCTORS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_GRID_DOCTORS} doctors per request")
+    days = check_date_range(start, end)
+    await ensure_doctors_exist(db, doctor_ids)
+
+    # one range query (or the occupancy index) for every doctor/day instead of one request per cell
+    grid = await booked_masks(db, doctor_ids, start, days)
+    doctor_schedules = await crud_async.get_schedules(db, doctor_ids)
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    open_masks = {d: [doctor_schedules[d].open_mask(day) for day in dates] for d in doctor_ids}
+
+    return {
+        "start": start,
+        "end": end,
+        "slots_per_day": max((m.bit_length() for masks in open_masks.values() for m in masks), default=0),
+        "doctors": [{"doctor_id": d, "booked": hex_masks(grid[d]), "open": hex_masks(open_masks[d])}
+                    for d in doctor_ids],
+    }
+
+
+@app.get("/slots/next-available", response_model=schemas.NextAvailable)
+async def next_available_slots(
+    doctor_ids: Optional[List[int]] = Query(None),
+    start: Optional[datetime.date] = None,
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS),
+    db: AsyncSession = Depends(get_db),
+):
+    """Earliest free slots across the given doctors (default: every verified doctor) from `start` on
+
+    The range is walked in SEARCH_CHUNK_DAYS chunks, one booked-slot query (or occupancy
+    index lookup) per chunk, and never past SEARCH_HORIZON_DAYS.
+    """
+    if doctor_ids:
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        if len(doctor_ids) > MAX_GRID_DOCTORS:
+            raise HTTPException(status_code=400, detail=f"at most {MAX_GRID_DOCTORS} doctors per request")
+        await ensure_doctors_exist(db, doctor_ids)
+    else:
+        doctor_ids = await crud_async.get_verified_doctor_ids(db)
+
+    now = datetime.datetime.now()
+    today = now.date()
+    start = max(start or today, today)
+    horizon = start + datetime.timedelta(days=SEARCH_HORIZON_DAYS - 1)
+    found = []
+    chunk_start = start
+    searched_until = start - datetime.timedelta(days=1)
+    doctor_schedules = await crud_async.get_schedules(db, doctor_ids) if doctor_ids else {}
+    while doctor_ids and chunk_start <= horizon and len(found) < limit:
+        days = min(SEARCH_CHUNK_DAYS, (horizon - chunk_start).days + 1)
+        booked = await booked_masks(db, doctor_ids, chunk_start, days)
+        for i in range(days):
+            day = chunk_start + datetime.timedelta(days=i)
+            started = now.time() if day == today else None  # today's slots that have begun are not on offer
+            free = [
+                (slot_start, doctor_id, s, slot_end)
+                for doctor_id in doctor_ids
+                for s, slot_start, slot_end in doctor_schedules[doctor_id].slots(day)
+                if not booked[doctor_id][i] >> (s - 1) & 1 and (started is None or slot_start > started)
+            ]
+            free.sort()
+            found.extend(
+                {"doctor_id": doctor_id, "date": day, "slot": s, "start": slot_start, "end": slot_end}
+                for slot_start, doctor_id, s, slot_end in free[:limit - len(found)]
+            )
+            searched_until = day
+            if len(found) >= limit:
+                break
+        chunk_start += datetime.timedelta(days=days)
+
+    return {"slots": found, "searched_until": max(searched_until, start)}
+
+
+def schedule_response(doctor_id: int, schedule: schedules.WeeklySchedule):
+    days = [
+        {"weekday": weekday, "start": t.start, "end": t.end, "slot_minutes": t.slot_minutes,
+         "breaks": [{"start": b_start, "end": b_end} for b_start, b_end in t.breaks]}
+        for weekday, t in sorted(schedule.weekdays.items())
+    ]
+    exceptions = [
+        {"date": day, "closed": True} if t is None else
+        {"date": day, "closed": False, "start": t.start, "end": t.end, "slot_minutes": t.slot_minutes}
+        for day, t in sorted(schedule.exceptions.items())
+    ]
+    return {"doctor_id": doctor_id, "default": schedule.is_default, "days": days, "exceptions": exceptions}
+
+
+def require_verified_doctor(current_user):
+    if current_user.role != "doctor":
+        raise HTTPException(status_code=403, detail="only doctors can manage schedules")
+    if current_user.is_verified == 0:
+        raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
+
+
+@app.get("/doctors/{doctor_id}/schedule", response_model=schemas.ScheduleOut)
+async def get_doctor_schedule(doctor_id: int, db: AsyncSession = Depends(get_db)):
+    await ensure_doctors_exist(db, [doctor_id])
+    return schedule_response(doctor_id, (await crud_async.get_schedules(db, [doctor_id]))[doctor_id])
+
+
+@app.put("/doctors/me/schedule", response_model=schemas.ScheduleOut)
+async def set_my_schedule(
+    data: schemas.WeeklyScheduleIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    """Replace the weekly template; refused (409) while it would move an upcoming pending/booked appointment"""
+    require_verified_doctor(current_user)
+    try:
+        await crud_async.set_weekly_schedule(db, current_user.id, data.days)
+    except ScheduleConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    schedules.cache.invalidate(current_user.id)
+    return schedule_response(current_user.id, (await crud_async.get_schedules(db, [current_user.id]))[current_user.id])
+
+
+@app.put("/doctors/me/schedule/exceptions", response_model=schemas.ScheduleOut)
+async def set_my_schedule_exception(
+    data: schemas.ScheduleExceptionIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    require_verified_doctor(current_user)
+    if data.start and data.end and data.end <= data.start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        await crud_async.set_schedule_exception(db, current_user.id, data)
+    except ScheduleConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    schedules.cache.invalidate(current_user.id)
+    return schedule_response(current_user.id, (await crud_async.get_schedules(db, [current_user.id]))[current_user.id])
+
+
+@app.delete("/doctors/me/schedule/exceptions/{date}", response_model=schemas.ScheduleOut)
+async def delete_my_schedule_exception(
+    date: datetime.date,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    require_verified_doctor(current_user)
+    try:
+        deleted = await crud_async.delete_schedule_exception(db, current_user.id, date)
+    except ScheduleConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="no exception for that date")
+    schedules.cache.invalidate(current_user.id)
+    return schedule_response(current_user.id, (await crud_async.get_schedules(db, [current_user.id]))[current_user.id])
+
+
+def parse_stream_keys(raw_keys):
+    if len(raw_keys) > MAX_STREAM_KEYS:
+        raise ValueError(f"at most {MAX_STREAM_KEYS} keys per subscription")
+    return [pubsub.parse_key(k) for k in raw_keys]
+
+
+@app.get("/availability/stream")
+async def availability_stream(request: Request, keys: List[str] = Query(...)):
+    """Server-sent events: one `slot-change` event per committed change to a subscribed doctor/date"""
+    try:
+        parsed = parse_stream_keys(keys)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="keys must look like <doctor_id>:YYYY-MM-DD")
+
+    subscriber = pubsub.Subscriber(asyncio.get_running_loop())
+    pubsub.hub.subscribe(subscriber, parsed)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    yield "event: resync\ndata: {}\n\n"
+                yield f"event: slot-change\ndata: {json.dumps(message)}\n\n"
+        finally:
+            pubsub.hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/ws/availability")
+async def availability_socket(websocket: WebSocket):
+    """Send {"subscribe": [keys]} / {"unsubscribe": [keys]}; receive {"doctor_id", "date"} change messages"""
+    await websocket.accept()
+    subscriber = pubsub.Subscriber(asyncio.get_running_loop())
+
+    async def forward():
+        while True:
+            message = await subscriber.queue.get()
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                await websocket.send_json({"resync": True})
+            await websocket.send_json(message)
+
+    sender = asyncio.create_task(forward())
+    try:
+        while True:
+            request = await websocket.receive_json()
+            try:
+                if "subscribe" in request:
+                    if len(subscriber.keys) + len(request["subscribe"]) > MAX_STREAM_KEYS:
+                        raise ValueError(f"at most {MAX_STREAM_KEYS} keys per subscription")
+                    pubsub.hub.subscribe(subscriber, parse_stream_keys(request["subscribe"]))
+                if "unsubscribe" in request:
+                    pubsub.hub.unsubscribe(subscriber, parse_stream_keys(request["unsubscribe"]))
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_json({"error": "keys must look like <doctor_id>:YYYY-MM-DD"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        pubsub.hub.unsubscribe(subscriber)
+
+
+async def transition(db: AsyncSession, appt: models.Appointment, action: str):
+    """Run crud.TRANSITIONS[action] on an appointment the handler loaded and authorized"""
+    try:
+        return await crud_async.transition_appointment(db, appt, action)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AppointmentChanged as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 @app.post("/appointments/book", response_model=schemas.AppointmentOut)
-def book_appointment(
+async def book_appointment(
     appt_in: schemas.AppointmentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     # Only patients can book and patient_id must match the authenticated user
@@ -117,8 +522,10 @@ def book_appointment(
     if appt_in.patient_id != current_user.id:
         raise HTTPException(status_code=403, detail="patient_id must match authenticated user")
     try:
-        appt = crud.create_appointment(db, appt_in)
+        appt = await crud_async.create_appointment(db, appt_in)
         return appt
+    except BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError:
@@ -127,12 +534,12 @@ def book_appointment(
 
 
 @app.delete("/appointments/{appointment_id}", response_model=schemas.AppointmentOut)
-def cancel_appointment(
+async def cancel_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appt = await crud_async.get_appointment(db, appointment_id)
     if not appt:
         raise HTTPException(status_code=404, detail="appointment not found")
     # Only the assigned doctor can delete/cancel the appointment
@@ -143,26 +550,62 @@ def cancel_appointment(
     if current_user.is_verified == 0:
         raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
     
-    cancelled = crud.cancel_appointment(db, appointment_id)
-    return cancelled
+    return await transition(db, appt, "cancel")
 
 
-@app.get("/patients/me/appointments")
-def patient_appointments(
-    db: Session = Depends(get_db),
+def appointment_feed_params(
+    status: Optional[str] = Query(None),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+):
+    if status is not None and status not in APPOINTMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(APPOINTMENT_STATUSES)}")
+    return {"status": status, "date_from": date_from, "date_to": date_to, "limit": limit, "cursor": cursor}
+
+
+def appointment_page(items, next_cursor):
+    # the rows are projected onto exactly the output schema's columns, so they go to orjson as is
+    return ORJSONResponse({"items": [row._asdict() for row in items], "next_cursor": next_cursor})
+
+
+async def live_appointment_page(db: AsyncSession, items, next_cursor):
+    """appointment_page plus each slot's start/end under the doctor's (cached) schedule
+
+    Schedule changes that would move a pending/booked slot are refused, so these
+    are the times the appointment was booked for.
+    """
+    doctor_schedules = await crud_async.get_schedules(db, sorted({row.doctor_id for row in items}))
+    rows = []
+    for row in items:
+        item = row._asdict()
+        item["start"], item["end"] = doctor_schedules[row.doctor_id].slot_times(row.date, row.slot) or (None, None)
+        rows.append(item)
+    return ORJSONResponse({"items": rows, "next_cursor": next_cursor})
+
+
+@app.get("/patients/me/appointments", response_model=schemas.AppointmentPage)
+async def patient_appointments(
+    params: dict = Depends(appointment_feed_params),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "patient":
         raise HTTPException(status_code=403, detail="forbidden")
 
-    appts = crud.get_patient_appointments(db, current_user.id)
-    return appts
+    try:
+        items, next_cursor = await crud_async.list_appointments_page(db, patient_id=current_user.id, **params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await live_appointment_page(db, items, next_cursor)
 
 
 
-@app.get("/doctors/me/appointments")
-def doctor_appointments(
-    db: Session = Depends(get_db),
+@app.get("/doctors/me/appointments", response_model=schemas.AppointmentPage)
+async def doctor_appointments(
+    params: dict = Depends(appointment_feed_params),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "doctor":
@@ -172,21 +615,116 @@ def doctor_appointments(
     if current_user.is_verified == 0:
         raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
 
-    appts = (
-        db.query(models.Appointment)
-        .filter(models.Appointment.doctor_id == current_user.id)
-        .all()
-    )
-    return appts
+    try:
+        items, next_cursor = await crud_async.list_appointments_page(db, doctor_id=current_user.id, **params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await live_appointment_page(db, items, next_cursor)
+
+
+def summary_row(first_day: datetime.date, days: int, offered: int, counts: dict) -> dict:
+    row = {"date": first_day, "days": days, "offered": offered}
+    row.update((status.lower(), counts.get(status, 0)) for status in APPOINTMENT_STATUSES)
+    held = row["pending"] + row["booked"]
+    row["utilization"] = round(held / offered, 4) if offered else 0.0
+    return row
 
 
-@app.post("/appointments/{appointment_id}/approve")
-def approve_appointment(
+@app.get("/doctors/me/summary", response_model=schemas.ScheduleSummary)
+async def doctor_schedule_summary(
+    start: datetime.date = Query(...),
+    end: datetime.date = Query(...),
+    group: str = Query("day"),
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    """Per-day (or per-week) appointment counts by status and slot utilization for the dashboard
+
+    Counts come from one GROUP BY over the live and archived appointments;
+    offered slots come from the cached schedule, so the response costs one query.
+    """
+    if current_user.role != "doctor":
+        raise HTTPException(status_code=403, detail="forbidden")
+    if current_user.is_verified == 0:
+        raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
+    if group not in SUMMARY_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group must be one of {', '.join(SUMMARY_GROUPS)}")
+    days = check_date_range(start, end, MAX_SUMMARY_DAYS)
+
+    counts = await crud_async.count_appointments_by_day(db, current_user.id, start, end)
+    schedule = (await crud_async.get_schedules(db, [current_user.id]))[current_user.id]
+
+    buckets = {}  # first day of the bucket -> [days, offered, {status: count}]
+    for day in (start + datetime.timedelta(days=i) for i in range(days)):
+        key = day if group == "day" else day - datetime.timedelta(days=day.weekday())
+        bucket = buckets.setdefault(key, [0, 0, {}])
+        bucket[0] += 1
+        bucket[1] += bin(schedule.open_mask(day)).count("1")
+        for status, count in counts.get(day, {}).items():
+            bucket[2][status] = bucket[2].get(status, 0) + count
+
+    totals = [0, 0, {}]
+    for bucket_days, offered, bucket_counts in buckets.values():
+        totals[0] += bucket_days
+        totals[1] += offered
+        for status, count in bucket_counts.items():
+            totals[2][status] = totals[2].get(status, 0) + count
+    return {
+        "doctor_id": current_user.id,
+        "start": start,
+        "end": end,
+        "group": group,
+        "rows": [summary_row(key, *bucket) for key, bucket in buckets.items()],
+        "totals": summary_row(start, *totals),
+    }
+
+
+# past and cancelled/rejected appointments, once archived out of the live feeds above
+@app.get("/patients/me/appointments/history", response_model=schemas.ArchivedAppointmentPage)
+async def patient_appointment_history(
+    params: dict = Depends(appointment_feed_params),
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    if current_user.role != "patient":
+        raise HTTPException(status_code=403, detail="forbidden")
+
+    try:
+        items, next_cursor = await crud_async.list_appointments_page(
+            db, patient_id=current_user.id, archived=True, **params
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return appointment_page(items, next_cursor)
+
+
+@app.get("/doctors/me/appointments/history", response_model=schemas.ArchivedAppointmentPage)
+async def doctor_appointment_history(
+    params: dict = Depends(appointment_feed_params),
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    if current_user.role != "doctor":
+        raise HTTPException(status_code=403, detail="forbidden")
+    if current_user.is_verified == 0:
+        raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
+
+    try:
+        items, next_cursor = await crud_async.list_appointments_page(
+            db, doctor_id=current_user.id, archived=True, **params
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return appointment_page(items, next_cursor)
+
+
+@app.post("/appointments/{appointment_id}/approve", response_model=schemas.AppointmentOut)
+async def approve_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
-    appt = db.query(models.Appointment).filter_by(id=appointment_id).first()
+    appt = await crud_async.get_appointment(db, appointment_id)
 
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -198,20 +736,17 @@ def approve_appointment(
     if current_user.is_verified == 0:
         raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
 
-    appt.status = "BOOKED"
-    db.commit()
-    db.refresh(appt)
-    return appt
+    return await transition(db, appt, "approve")
 
 
 
-@app.post("/appointments/{appointment_id}/reject")
-def reject_appointment(
+@app.post("/appointments/{appointment_id}/reject", response_model=schemas.AppointmentOut)
+async def reject_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
-    appt = db.query(models.Appointment).filter_by(id=appointment_id).first()
+    appt = await crud_async.get_appointment(db, appointment_id)
 
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -223,140 +758,252 @@ def reject_appointment(
     if current_user.is_verified == 0:
         raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
 
-    appt.status = "CANCELLED"
-    db.commit()
-    db.refresh(appt)
-    return appt
+    # a rejected request has always ended up CANCELLED, like a doctor cancel
+    return await transition(db, appt, "cancel")
 
 
-@app.post("/doctors/register")
-def register_doctor(data: schemas.DoctorCreate, db: Session = Depends(get_db)):
-    doctor = models.Doctor(
-        name=data.name,
-        email=data.email,
-        hashed_password=crud.get_password_hash(data.password),
-        license_number=data.license_number,
-        is_verified=0
-    )
-    db.add(doctor)
-    db.commit()
-    db.refresh(doctor)
+@app.post("/appointments/bulk-book", response_model=List[schemas.BulkBookResult])
+async def bulk_book_appointments(
+    data: schemas.BulkBookRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    if current_user.role != "patient":
+        raise HTTPException(status_code=403, detail="only patients can book appointments")
+    if data.patient_id != current_user.id:
+        raise HTTPException(status_code=403, detail="patient_id must match authenticated user")
+    try:
+        results = await crud_async.bulk_create_appointments(db, data.doctor_id, data.patient_id, data.visits)
+    except BookingConflict as e:
+        raise HTTPException(status_code=409, detail=f"{e}; nothing was booked, please retry")
+    return [
+        {"date": d, "slot": slot, "ok": appointment_id is not None, "appointment_id": appointment_id, "error": error}
+        for d, slot, appointment_id, error in results
+    ]
+
+
+BULK_STATUS_ERRORS = {"not_found": "Appointment not found", "forbidden": "Not allowed"}
+
+
+async def bulk_set_status(data: schemas.BulkStatusRequest, action: str, db: AsyncSession, current_user):
+    if current_user.role != "doctor":
+        raise HTTPException(status_code=403, detail="Not allowed")
+    if current_user.is_verified == 0:
+        raise HTTPException(status_code=403, detail="Your account is not verified by admin yet. Please wait.")
+
+    try:
+        outcomes = await crud_async.bulk_transition_appointments(db, current_user.id, data.appointment_ids, action)
+    except AppointmentChanged as e:
+        raise HTTPException(status_code=409, detail=f"{e}; nothing was updated")
+    target = TRANSITIONS[action].target
+    errors = dict(BULK_STATUS_ERRORS, invalid=TRANSITIONS[action].error)
+    return [
+        {"appointment_id": appointment_id, "ok": outcome == "updated",
+         "status": target if outcome == "updated" else None, "error": errors.get(outcome)}
+        for appointment_id, outcome in outcomes.items()
+    ]
+
+
+@app.post("/appointments/bulk-approve", response_model=List[schemas.BulkStatusResult])
+async def bulk_approve_appointments(
+    data: schemas.BulkStatusRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    return await bulk_set_status(data, "approve", db, current_user)
+
+
+@app.post("/appointments/bulk-reject", response_model=List[schemas.BulkStatusResult])
+async def bulk_reject_appointments(
+    data: schemas.BulkStatusRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    # same transition as the single /reject endpoint
+    return await bulk_set_status(data, "cancel", db, current_user)
+
+
+@app.post("/doctors/register", response_model=schemas.Message)
+async def register_doctor(data: schemas.DoctorCreate, db: AsyncSession = Depends(get_db)):
+    try:
+        hashed_password = await hashing.hash_password(data.password)
+        await crud_async.create_doctor(db, data, hashed_password)
+    except hashing.HashingBusy as e:
+        raise hashing_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Doctor registered. Await admin verification"}
 
 
-@app.get("/admin/pending-doctors")
-def pending_doctors(
-    db: Session = Depends(get_db),
+@app.get("/admin/pending-doctors", response_model=List[schemas.DoctorOut])
+async def pending_doctors(
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
-    doctors = db.query(models.Doctor).filter(models.Doctor.is_verified == 0).all()
+    doctors = await crud_async.list_pending_doctors(db)
     return doctors
 
 
-@app.put("/admin/verify-doctor/{doctor_id}")
-def verify_doctor(
+@app.put("/admin/verify-doctor/{doctor_id}", response_model=schemas.Message)
+async def verify_doctor(
     doctor_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-    if not doctor:
+    if not await crud_async.set_doctor_verification(db, doctor_id, 1):
         raise HTTPException(status_code=404, detail="Doctor not found")
-
-    doctor.is_verified = 1
-    db.commit()
+    principal_cache.invalidate("doctor", doctor_id)
+    doctor_directory.invalidate()
     return {"message": "Doctor verified"}
 
 
-@app.put("/admin/reject-doctor/{doctor_id}")
-def reject_doctor(
+@app.put("/admin/reject-doctor/{doctor_id}", response_model=schemas.Message)
+async def reject_doctor(
     doctor_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-    if not doctor:
+    if not await crud_async.set_doctor_verification(db, doctor_id, 2):  # 2 = rejected
         raise HTTPException(status_code=404, detail="Doctor not found")
-
-    doctor.is_verified = 2  # 2 = rejected
-    db.commit()
+    principal_cache.invalidate("doctor", doctor_id)
+    doctor_directory.invalidate()
     return {"message": "Doctor rejected"}
 
 
-@app.get("/admin/all-doctors")
-def get_all_doctors(
-    db: Session = Depends(get_db),
+@app.get("/admin/all-doctors", response_model=List[schemas.DoctorOut])
+async def get_all_doctors(
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
-    doctors = crud.get_all_doctors_with_status(db)
+    doctors = await crud_async.get_all_doctors_with_status(db)
     return doctors
 
 
-@app.post("/appointments/{appointment_id}/reschedule")
-def reschedule_appointment(
+@app.post("/appointments/{appointment_id}/reschedule", response_model=schemas.AppointmentOut)
+async def reschedule_appointment(
     appointment_id: int,
     new_date: str = Query(...),
     new_slot: int = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "patient":
         raise HTTPException(status_code=403, detail="only patients can reschedule appointments")
     
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appt = await crud_async.get_appointment(db, appointment_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     if appt.patient_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only reschedule your own appointments")
-    
-    if appt.status != "BOOKED":
-        raise HTTPException(status_code=400, detail="Can only reschedule confirmed appointments")
-    
+
     try:
         date_obj = datetime.date.fromisoformat(new_date)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format; use YYYY-MM-DD")
     
     try:
-        updated_appt = crud.reschedule_appointment(db, appointment_id, date_obj, new_slot)
-        return updated_appt
+        return await crud_async.reschedule_appointment(db, appt, date_obj, new_slot)
+    except (BookingConflict, AppointmentChanged) as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError:
         raise HTTPException(status_code=409, detail="New slot already booked")
 
 
-@app.post("/appointments/{appointment_id}/patient-cancel")
-def patient_cancel_appointment(
+@app.post("/appointments/{appointment_id}/patient-cancel", response_model=schemas.AppointmentOut)
+async def patient_cancel_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: object = Depends(get_current_user),
 ):
     if current_user.role != "patient":
         raise HTTPException(status_code=403, detail="only patients can cancel their appointments")
     
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appt = await crud_async.get_appointment(db, appointment_id)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     if appt.patient_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only cancel your own appointments")
-    
-    if appt.status != "BOOKED":
-        raise HTTPException(status_code=400, detail="Can only cancel confirmed appointments")
-    
-    cancelled = crud.cancel_appointment(db, appointment_id)
-    return cancelled
+
+    return await transition(db, appt, "patient_cancel")
+
+
+@app.get("/admin/appointments/export", response_class=StreamingResponse)
+async def export_appointments(
+    format: str = Query("csv"),
+    gzip: bool = Query(False),
+    source: str = Query("all"),
+    doctor_id: Optional[int] = Query(None),
+    status: Optional[str] = Query(None),
+    date_from: Optional[datetime.date] = Query(None),
+    date_to: Optional[datetime.date] = Query(None),
+    current_user: object = Depends(get_current_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.MEDIA_TYPES)}")
+    if source not in export.SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(export.SOURCES)}")
+    if status is not None and status not in APPOINTMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(APPOINTMENT_STATUSES)}")
+
+    filename = f"appointments.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export.stream(format, gzip, source, doctor_id=doctor_id, status=status, date_from=date_from, date_to=date_to),
+        media_type="application/gzip" if gzip else export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/admin/analytics", response_model=schemas.AdminAnalytics)
+async def admin_analytics(
+    start: datetime.date = Query(...),
+    end: datetime.date = Query(...),
+    slots: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    """Utilization, cancel/reject rates and booking lead time per doctor, and the busiest slots
+
+    Served from the rollups the write paths keep (app/analytics.py); no
+    appointment rows are read per request.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    check_date_range(start, end, MAX_SUMMARY_DAYS)
+    return await db.run_sync(analytics.report, start, end, slots)
+
+
+@app.get("/admin/occupancy/check", response_model=schemas.OccupancyCheck)
+async def check_occupancy_index(
+    db: AsyncSession = Depends(get_db),
+    current_user: object = Depends(get_current_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    if not occupancy.index.enabled:
+        raise HTTPException(status_code=404, detail="occupancy index is disabled")
+
+    problems = await db.run_sync(occupancy.index.check)
+    return {"consistent": not problems, "problems": problems[:100], "problem_count": len(problems)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return metrics.render()
@@ -0,0 +1,153 @@
+"""Idempotent schema upgrades for databases created by older versions of the app.
+
+`Base.metadata.create_all` only creates missing tables, so anything added to an
+existing table (indexes, columns) has to be applied here. Every step checks the
+current schema first, so `upgrade` is safe to run on every startup.
+"""
+from sqlalchemy import Integer, inspect, text
+from sqlalchemy.orm import Session
+from . import models
+
+
+def create_missing_indexes(engine):
+    """Create any index declared on the models that the database does not have yet"""
+    inspector = inspect(engine)
+    created = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    if created and engine.dialect.name == "sqlite":
+        # refresh planner statistics so the new indexes are picked up
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return created
+
+
+# old string value -> SMALLINT; anything unrecognised becomes NULL, like an unset status
+STATUS_TO_INT = "CASE status {} END".format(
+    " ".join(f"WHEN '{s.name}' THEN {s.value}" for s in models.AppointmentStatus)
+)
+
+
+def rebuild_sqlite_table(conn, inspector, table, expressions=None):
+    """Recreate `table` from its model definition and copy the rows over
+
+    SQLite cannot alter a column type or table options in place. expressions
+    maps a column name to the SQL that computes its new value from the old row.
+    """
+    expressions = expressions or {}
+    for name in (ix["name"] for ix in inspector.get_indexes(table.name)):
+        conn.execute(text(f'DROP INDEX "{name}"'))
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+    table.create(bind=conn)
+    columns = [c.name for c in table.columns]
+    values = [expressions.get(name, name) for name in columns]
+    conn.execute(text(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) SELECT {', '.join(values)} FROM {table.name}_old"
+    ))
+    conn.execute(text(f"DROP TABLE {table.name}_old"))
+    conn.execute(text(f"ANALYZE {table.name}"))
+
+
+def convert_appointment_status(engine):
+    """Turn appointments.status from the old VARCHAR names into AppointmentStatus SMALLINTs"""
+    inspector = inspect(engine)
+    if not inspector.has_table("appointments"):
+        return False
+    column = next(c for c in inspector.get_columns("appointments") if c["name"] == "status")
+    if isinstance(column["type"], Integer):
+        return False
+
+    table = models.Appointment.__table__
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            rebuild_sqlite_table(conn, inspector, table, {"status": STATUS_TO_INT})
+        else:
+            # indexes over status are rebuilt by create_missing_indexes, which runs next
+            for index in table.indexes:
+                if "status" in index.columns:
+                    conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+            conn.execute(text(f"ALTER TABLE appointments ALTER COLUMN status TYPE SMALLINT USING {STATUS_TO_INT}"))
+    return True
+
+
+def appointment_ids_autoincrement(engine):
+    """Give SQLite's appointments table AUTOINCREMENT so ids of archived rows are never reused"""
+    if engine.dialect.name != "sqlite":
+        return False
+    inspector = inspect(engine)
+    if not inspector.has_table("appointments"):
+        return False
+    with engine.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'appointments'")).scalar()
+        if "AUTOINCREMENT" in sql.upper():
+            return False
+        rebuild_sqlite_table(conn, inspector, models.Appointment.__table__)
+        # ids already handed out and archived stay reserved too
+        if inspector.has_table("appointments_archive"):
+            archived = conn.execute(text("SELECT coalesce(max(id), 0) FROM appointments_archive")).scalar()
+            updated = conn.execute(text(
+                "UPDATE sqlite_sequence SET seq = max(seq, :archived) WHERE name = 'appointments'"
+            ), {"archived": archived}).rowcount
+            if not updated and archived:
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('appointments', :archived)"),
+                             {"archived": archived})
+    return True
+
+
+def archive_terminal_appointments(engine):
+    """Move cancelled/rejected rows an older version left in the live table to the archive
+
+    A cancel now archives its row in the same transaction; rows from before
+    that would keep holding their slot until the archiver ran.
+    """
+    from . import archive  # archive runs `upgrade` from its own command line
+
+    inspector = inspect(engine)
+    if not inspector.has_table("appointments") or not inspector.has_table("appointments_archive"):
+        return 0
+    with engine.begin() as conn:
+        return archive.move_to_archive(conn, [models.Appointment.status.in_(models.TERMINAL_STATUSES)])
+
+
+def rebuild_stale_rollups(engine):
+    """Fill the analytics rollups once for a database that has appointments but no rollups yet
+
+    Versions before the rollups existed left the tables empty; from then on
+    the write paths keep them current.
+    """
+    from . import analytics  # analytics runs `upgrade` from its own command line
+
+    inspector = inspect(engine)
+    if not inspector.has_table("appointment_daily_stats") or not inspector.has_table("appointments"):
+        return False
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT 1 FROM appointment_daily_stats LIMIT 1")).first():
+            return False
+        if not any(
+            inspector.has_table(table) and conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first()
+            for table in ("appointments", "appointments_archive")
+        ):
+            return False
+    with Session(engine) as db:
+        analytics.rebuild(db)
+    return True
+
+
+STEPS = [
+    convert_appointment_status,
+    appointment_ids_autoincrement,
+    create_missing_indexes,
+    archive_terminal_appointments,
+    rebuild_stale_rollups,
+]
+
+
+def upgrade(engine):
+    """Run every migration step; returns {step name: result}"""
+    return {step.__name__: step(engine) for step in STEPS}
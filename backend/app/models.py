@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, UniqueConstraint
+import enum
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, DateTime, Time, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -36,22 +38,155 @@ class Patient(Base):
     appointments = relationship("Appointment", back_populates="patient", foreign_keys='Appointment.patient_id')
 
 
+class AppointmentStatus(enum.IntEnum):
+    PENDING = 1
+    BOOKED = 2
+    CANCELLED = 3
+    REJECTED = 4
+
+
+class StatusType(TypeDecorator):
+    """Appointment status stored as a SMALLINT (AppointmentStatus) and used everywhere as its name
+
+    Bound values and results are converted at the driver boundary, so the
+    code, the filters and the API keep the string names while the table and
+    its indexes hold one small integer per row.
+    """
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, AppointmentStatus):
+            return value.value
+        return AppointmentStatus[value].value
+
+    def process_literal_param(self, value, dialect):
+        # statements compiled with literal_binds render the SMALLINT too
+        return self.process_bind_param(value, dialect)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else AppointmentStatus(value).name
+
+
+ACTIVE_STATUSES = ("PENDING", "BOOKED")
+TERMINAL_STATUSES = ("CANCELLED", "REJECTED")
+
+
 class Appointment(Base):
     __tablename__ = "appointments"
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     date = Column(Date, nullable=False)
-    slot = Column(Integer, nullable=False)  # 1..4
+    slot = Column(Integer, nullable=False)  # 1-based position in the doctor's schedule for that day
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    status = Column(String, default="PENDING")  # PENDING, BOOKED, CANCELLED, REJECTED
+    status = Column(StatusType, default="PENDING")  # PENDING, BOOKED, CANCELLED, REJECTED
     is_rescheduled = Column(Integer, default=0)  # 0 = no, 1 = yes
 
     __table_args__ = (
         UniqueConstraint("doctor_id", "date", "slot", name="uix_doctor_date_slot"),
         UniqueConstraint("patient_id", "date", "slot", name="uix_patient_date_slot"),
+        # the two unique constraints above already serve doctor_id / patient_id (+ date) prefix lookups
+        # covering index for availability and the grid: answers (slot, patient_id, status)
+        # without touching the table (the id is the rowid, which every SQLite index carries)
+        Index("ix_appointments_doctor_date_cover", "doctor_id", "date", "slot", "patient_id", "status"),
+        # archived rows keep their id, so SQLite must never hand out the id of a deleted (archived) row again
+        {"sqlite_autoincrement": True},
     )
 
     doctor = relationship("Doctor", foreign_keys=[doctor_id], back_populates="appointments")
     patient = relationship("Patient", foreign_keys=[patient_id], back_populates="appointments")
+
+
+class AppointmentArchive(Base):
+    """Past and cancelled/rejected appointments moved out of the live table (see app/archive.py)
+
+    Same columns and ids as appointments, without the slot constraints: an
+    archived row no longer holds its slot.
+    """
+    __tablename__ = "appointments_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    slot = Column(Integer, nullable=False)
+    created_at = Column(DateTime)
+    status = Column(StatusType)
+    is_rescheduled = Column(Integer, default=0)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # the history feeds: (doctor | patient) ordered by (date, slot, id)
+        Index("ix_appointments_archive_doctor_date", "doctor_id", "date", "slot"),
+        Index("ix_appointments_archive_patient_date", "patient_id", "date", "slot"),
+    )
+
+
+class AppointmentDailyStats(Base):
+    """Rollup of live and archived appointments per doctor, day and status, kept by the write paths (app/analytics.py)"""
+    __tablename__ = "appointment_daily_stats"
+    doctor_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    status = Column(StatusType, primary_key=True)
+    appointments = Column(Integer, nullable=False, default=0)
+    # booking lead time: summed days from created_at to the appointment date, over the rows that have a created_at
+    lead_days = Column(Integer, nullable=False, default=0)
+    lead_samples = Column(Integer, nullable=False, default=0)
+
+
+class AppointmentSlotStats(Base):
+    """Rollup of pending/booked appointments per day, slot and doctor
+
+    Keyed by doctor too, so bookings with different doctors never update the
+    same row; the key starts with the date for the report's range scan.
+    """
+    __tablename__ = "appointment_slot_stats"
+    date = Column(Date, primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    appointments = Column(Integer, nullable=False, default=0)
+
+
+class DoctorSchedule(Base):
+    """Weekly working hours: one row per weekday the doctor works (0 = Monday)"""
+    __tablename__ = "doctor_schedules"
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    weekday = Column(Integer, nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    slot_minutes = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("doctor_id", "weekday", name="uix_doctor_schedule_weekday"),
+    )
+
+
+class ScheduleBreak(Base):
+    """A gap inside a weekday's working hours (lunch etc.); no slot overlaps it"""
+    __tablename__ = "schedule_breaks"
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False, index=True)
+    weekday = Column(Integer, nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+
+
+class ScheduleException(Base):
+    """Overrides the weekly template for one date: closed, or different hours / slot length"""
+    __tablename__ = "schedule_exceptions"
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    is_closed = Column(Integer, default=0)  # 1 = no slots that day
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    slot_minutes = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("doctor_id", "date", name="uix_schedule_exception_date"),
+    )
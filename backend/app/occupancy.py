@@ -0,0 +1,153 @@
+"""In-process slot occupancy index for the availability hot path.
+
+Per (doctor_id, date) the index keeps a bitmask of taken slots (bit slot - 1),
+plus the (appointment_id, patient_id) holding each taken slot so the
+availability response can be built without a query. It is warmed from the
+appointments table at startup (today onwards) and kept current write-through:
+crud records booked/released slots in session.info and they are applied once
+the transaction commits. Dates before the warm horizon and doctors it has not
+seen yet fall back to the database. Like pubsub, the index is per process, so
+only enable it (OCCUPANCY_INDEX=1) with a single worker.
+"""
+import datetime
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import models
+
+OCCUPANCY_OPS = "occupancy_ops"
+
+
+class OccupancyIndex:
+    def __init__(self):
+        self.enabled = False
+        self.from_date = None
+        self._masks = {}  # (doctor_id, date) -> int bitmask
+        self._holders = {}  # (doctor_id, date, slot) -> (appointment_id, patient_id)
+        self._doctor_ids = set()
+        self._lock = threading.Lock()
+
+    def warm(self, db: Session, from_date: datetime.date = None):
+        """(Re)load every pending/booked appointment from from_date (default today) onwards and enable the index"""
+        from_date = from_date or datetime.date.today()
+        masks, holders = {}, {}
+        rows = db.query(
+            models.Appointment.id,
+            models.Appointment.doctor_id,
+            models.Appointment.patient_id,
+            models.Appointment.date,
+            models.Appointment.slot,
+        ).filter(models.Appointment.date >= from_date, models.Appointment.status.in_(models.ACTIVE_STATUSES))
+        for r in rows:
+            masks[(r.doctor_id, r.date)] = masks.get((r.doctor_id, r.date), 0) | (1 << (r.slot - 1))
+            holders[(r.doctor_id, r.date, r.slot)] = (r.id, r.patient_id)
+        doctor_ids = {r.id for r in db.query(models.Doctor.id)}
+        with self._lock:
+            self._masks, self._holders, self._doctor_ids = masks, holders, doctor_ids
+            self.from_date = from_date
+            self.enabled = True
+
+    def covers(self, day: datetime.date) -> bool:
+        return self.enabled and day >= self.from_date
+
+    def has_doctor(self, doctor_id: int) -> bool:
+        return doctor_id in self._doctor_ids
+
+    def add_doctor(self, doctor_id: int):
+        with self._lock:
+            self._doctor_ids.add(doctor_id)
+
+    def mask(self, doctor_id: int, day: datetime.date) -> int:
+        return self._masks.get((doctor_id, day), 0)
+
+    def holders(self, doctor_id: int, day: datetime.date):
+        """{slot: (appointment_id, patient_id)} for the taken slots of a doctor-day"""
+        with self._lock:
+            mask = self._masks.get((doctor_id, day), 0)
+            slot, found = 1, {}
+            while mask:
+                if mask & 1:
+                    found[slot] = self._holders[(doctor_id, day, slot)]
+                mask >>= 1
+                slot += 1
+            return found
+
+    def book(self, doctor_id, day, slot, appointment_id, patient_id):
+        if day < self.from_date:
+            return
+        with self._lock:
+            self._masks[(doctor_id, day)] = self._masks.get((doctor_id, day), 0) | (1 << (slot - 1))
+            self._holders[(doctor_id, day, slot)] = (appointment_id, patient_id)
+
+    def release(self, doctor_id, day, slot, appointment_id):
+        with self._lock:
+            holder = self._holders.get((doctor_id, day, slot))
+            # a later booking may already hold the slot again
+            if holder is None or holder[0] != appointment_id:
+                return
+            del self._holders[(doctor_id, day, slot)]
+            mask = self._masks.get((doctor_id, day), 0) & ~(1 << (slot - 1))
+            if mask:
+                self._masks[(doctor_id, day)] = mask
+            else:
+                self._masks.pop((doctor_id, day), None)
+
+    def check(self, db: Session):
+        """Compare the index with the appointments table; returns a list of discrepancy descriptions"""
+        expected = {}
+        rows = db.query(
+            models.Appointment.id,
+            models.Appointment.doctor_id,
+            models.Appointment.patient_id,
+            models.Appointment.date,
+            models.Appointment.slot,
+        ).filter(models.Appointment.date >= self.from_date, models.Appointment.status.in_(models.ACTIVE_STATUSES))
+        for r in rows:
+            expected[(r.doctor_id, r.date, r.slot)] = (r.id, r.patient_id)
+        with self._lock:
+            actual = dict(self._holders)
+            masks = dict(self._masks)
+
+        problems = []
+        for key in expected.keys() - actual.keys():
+            problems.append(f"missing {key}: appointment {expected[key][0]} not indexed")
+        for key in actual.keys() - expected.keys():
+            problems.append(f"stale {key}: appointment {actual[key][0]} no longer in the database")
+        for key in expected.keys() & actual.keys():
+            if expected[key] != actual[key]:
+                problems.append(f"mismatch {key}: database {expected[key]}, index {actual[key]}")
+        slots_by_day = {}
+        for doctor_id, day, slot in actual:
+            slots_by_day.setdefault((doctor_id, day), set()).add(slot)
+        for key in masks.keys() | slots_by_day.keys():
+            mask = masks.get(key, 0)
+            bits = {s for s in range(1, mask.bit_length() + 1) if mask & (1 << (s - 1))}
+            if bits != slots_by_day.get(key, set()):
+                problems.append(f"bitmask {key}: bits {sorted(bits)}, holders {sorted(slots_by_day.get(key, ()))}")
+        return problems
+
+
+index = OccupancyIndex()
+
+
+def record_booked(db: Session, doctor_id, day, slot, appointment_id, patient_id):
+    """Apply to the index once db commits"""
+    db.info.setdefault(OCCUPANCY_OPS, []).append((index.book, (doctor_id, day, slot, appointment_id, patient_id)))
+
+
+def record_released(db: Session, doctor_id, day, slot, appointment_id):
+    """Apply to the index once db commits"""
+    db.info.setdefault(OCCUPANCY_OPS, []).append((index.release, (doctor_id, day, slot, appointment_id)))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_ops(session):
+    ops = session.info.pop(OCCUPANCY_OPS, ())
+    if index.enabled:
+        for op, args in ops:
+            op(*args)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_ops(session, previous_transaction):
+    session.info.pop(OCCUPANCY_OPS, None)
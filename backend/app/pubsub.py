@@ -0,0 +1,97 @@
+"""In-process fanout of slot changes to subscribed clients.
+
+crud write paths call record_slot_change(db, doctor_id, date) while they work;
+the keys are held in session.info and published only once the transaction
+commits (a rollback drops them), so subscribers never hear about writes that
+did not happen. Subscribers are asyncio queues, so an idle subscriber costs a
+queue and a parked coroutine, not a thread. Fanout is per process: with several
+workers each one only sees its own writes.
+"""
+import asyncio
+import datetime
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+SLOT_CHANGES = "slot_changes"
+# events buffered per subscriber before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.keys = set()
+        self.overflowed = False
+
+    def _deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # the client must resync; it is told once the queue drains
+            self.overflowed = True
+
+
+class SlotHub:
+    """Maps (doctor_id, date) keys to the subscribers listening on them"""
+
+    def __init__(self):
+        self._subscribers = {}  # key -> set[Subscriber]
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber: Subscriber, keys):
+        with self._lock:
+            for key in keys:
+                self._subscribers.setdefault(key, set()).add(subscriber)
+                subscriber.keys.add(key)
+
+    def unsubscribe(self, subscriber: Subscriber, keys=None):
+        with self._lock:
+            for key in list(subscriber.keys if keys is None else keys):
+                listeners = self._subscribers.get(key)
+                if listeners is not None:
+                    listeners.discard(subscriber)
+                    if not listeners:
+                        del self._subscribers[key]
+                subscriber.keys.discard(key)
+
+    def publish(self, key, message):
+        """Thread-safe: deliver message to every subscriber of key on its own event loop"""
+        with self._lock:
+            listeners = list(self._subscribers.get(key, ()))
+        for subscriber in listeners:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._deliver, message)
+            except RuntimeError:
+                # loop already closed; the subscriber is going away
+                pass
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({s for listeners in self._subscribers.values() for s in listeners})
+
+
+hub = SlotHub()
+
+
+def parse_key(raw: str):
+    """'<doctor_id>:<YYYY-MM-DD>' -> (doctor_id, date); raises ValueError"""
+    doctor_id, day = raw.split(":", 1)
+    return int(doctor_id), datetime.date.fromisoformat(day)
+
+
+def record_slot_change(db: Session, doctor_id: int, day: datetime.date):
+    """Queue a (doctor_id, date) change notification for when db commits"""
+    db.info.setdefault(SLOT_CHANGES, set()).add((doctor_id, day))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_changes(session):
+    for doctor_id, day in session.info.pop(SLOT_CHANGES, ()):
+        hub.publish((doctor_id, day), {"doctor_id": doctor_id, "date": day.isoformat()})
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_changes(session, previous_transaction):
+    session.info.pop(SLOT_CHANGES, None)
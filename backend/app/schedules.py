@@ -0,0 +1,204 @@
+"""Per-doctor schedule templates and the slots they produce.
+
+A day is a working window minus its breaks; each remaining free interval is cut
+into slot_minutes pieces (a remainder shorter than a slot is dropped) and the
+pieces are numbered 1..n in time order. That number is the `slot` stored on an
+appointment. Weekly templates live in doctor_schedules / schedule_breaks, a
+schedule_exceptions row replaces the template for one date (keeping the
+weekday's breaks that fall inside its hours), and a doctor with no weekly rows
+keeps the legacy day of four two-hour slots.
+
+The slot list is computed once per distinct template (lru_cache), so a month of
+availability for a doctor with 40+ slots a day costs one dict lookup per day
+plus a bitmask test per slot against the booked slots. Templates are cached per
+doctor in process; the schedule endpoints invalidate their own doctor and the
+TTL bounds staleness in other worker processes.
+"""
+import datetime
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from . import config, models
+
+
+class DayTemplate(NamedTuple):
+    start: datetime.time
+    end: datetime.time
+    slot_minutes: int
+    breaks: Tuple[Tuple[datetime.time, datetime.time], ...] = ()
+
+
+# 9-11, 11-13, lunch, 14-16, 16-18: the day every doctor had before schedules existed
+LEGACY_TEMPLATE = DayTemplate(
+    datetime.time(9), datetime.time(18), 120, ((datetime.time(13), datetime.time(14)),)
+)
+
+
+def _minutes(t: datetime.time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def _time(minutes: int) -> datetime.time:
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def clip_breaks(breaks, start: datetime.time, end: datetime.time):
+    """The breaks that fall inside start-end, cut back to that window"""
+    return tuple((max(a, start), min(b, end)) for a, b in breaks if a < end and b > start)
+
+
+@lru_cache(maxsize=1024)
+def day_slots(template: DayTemplate) -> Tuple[Tuple[int, datetime.time, datetime.time], ...]:
+    """(slot, start, end) for every slot the template offers, in time order"""
+    start, end = _minutes(template.start), _minutes(template.end)
+    free = []
+    cursor = start
+    for break_start, break_end in sorted((_minutes(a), _minutes(b)) for a, b in template.breaks):
+        if break_start >= end:
+            break
+        if break_start > cursor:
+            free.append((cursor, break_start))
+        cursor = max(cursor, break_end)
+    if cursor < end:
+        free.append((cursor, end))
+
+    slots = []
+    length = template.slot_minutes
+    for a, b in free:
+        for s in range(a, b - length + 1, length):
+            slots.append((len(slots) + 1, _time(s), _time(s + length)))
+    return tuple(slots)
+
+
+@lru_cache(maxsize=1024)
+def open_mask(template: DayTemplate) -> int:
+    """Bitmask of the slots the template offers, bit (slot - 1) like the occupancy masks"""
+    return (1 << len(day_slots(template))) - 1
+
+
+class WeeklySchedule:
+    def __init__(self, weekdays: Dict[int, DayTemplate], exceptions: Dict[datetime.date, Optional[DayTemplate]]):
+        self.weekdays = weekdays  # weekday (0 = Monday) -> template; missing weekdays are days off
+        self.exceptions = exceptions  # date -> template, None when closed
+
+    @property
+    def is_default(self) -> bool:
+        return not self.weekdays
+
+    def template_for(self, day: datetime.date) -> Optional[DayTemplate]:
+        if day in self.exceptions:
+            return self.exceptions[day]
+        if not self.weekdays:
+            return LEGACY_TEMPLATE
+        return self.weekdays.get(day.weekday())
+
+    def slots(self, day: datetime.date):
+        template = self.template_for(day)
+        return day_slots(template) if template else ()
+
+    def open_mask(self, day: datetime.date) -> int:
+        template = self.template_for(day)
+        return open_mask(template) if template else 0
+
+    def offers(self, day: datetime.date, slot: int) -> bool:
+        return slot >= 1 and bool(self.open_mask(day) >> (slot - 1) & 1)
+
+    def slot_times(self, day: datetime.date, slot: int) -> Optional[Tuple[datetime.time, datetime.time]]:
+        """(start, end) of `slot` on `day`, or None when the day does not offer it"""
+        slots = self.slots(day)
+        return slots[slot - 1][1:] if 1 <= slot <= len(slots) else None
+
+
+def load_schedules(db: Session, doctor_ids) -> Dict[int, WeeklySchedule]:
+    """Build the schedule of every given doctor with three queries in total"""
+    doctor_ids = list(doctor_ids)
+    breaks = defaultdict(list)
+    for b in db.query(
+        models.ScheduleBreak.doctor_id, models.ScheduleBreak.weekday,
+        models.ScheduleBreak.start_time, models.ScheduleBreak.end_time,
+    ).filter(models.ScheduleBreak.doctor_id.in_(doctor_ids)):
+        breaks[(b.doctor_id, b.weekday)].append((b.start_time, b.end_time))
+
+    weekdays = {doctor_id: {} for doctor_id in doctor_ids}
+    for r in db.query(
+        models.DoctorSchedule.doctor_id, models.DoctorSchedule.weekday, models.DoctorSchedule.start_time,
+        models.DoctorSchedule.end_time, models.DoctorSchedule.slot_minutes,
+    ).filter(models.DoctorSchedule.doctor_id.in_(doctor_ids)):
+        weekdays[r.doctor_id][r.weekday] = DayTemplate(
+            r.start_time, r.end_time, r.slot_minutes, tuple(sorted(breaks[(r.doctor_id, r.weekday)]))
+        )
+
+    exceptions = {doctor_id: {} for doctor_id in doctor_ids}
+    for e in db.query(
+        models.ScheduleException.doctor_id, models.ScheduleException.date, models.ScheduleException.is_closed,
+        models.ScheduleException.start_time, models.ScheduleException.end_time,
+        models.ScheduleException.slot_minutes,
+    ).filter(models.ScheduleException.doctor_id.in_(doctor_ids)):
+        if e.is_closed:
+            exceptions[e.doctor_id][e.date] = None
+            continue
+        # unset fields fall back to the regular template for that weekday (legacy if there is none)
+        base = weekdays[e.doctor_id].get(e.date.weekday()) or LEGACY_TEMPLATE
+        start, end = e.start_time or base.start, e.end_time or base.end
+        exceptions[e.doctor_id][e.date] = DayTemplate(
+            start, end, e.slot_minutes or base.slot_minutes, clip_breaks(base.breaks, start, end)
+        )
+
+    return {doctor_id: WeeklySchedule(weekdays[doctor_id], exceptions[doctor_id]) for doctor_id in doctor_ids}
+
+
+class ScheduleCache:
+    """Short-TTL in-process cache of WeeklySchedule keyed by doctor id"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # doctor_id -> (expires_at, WeeklySchedule)
+        self._version = 0  # bumped by invalidate(); a load that raced one is not stored
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, doctor_ids) -> Dict[int, WeeklySchedule]:
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            version = self._version
+            for doctor_id in doctor_ids:
+                entry = self._entries.get(doctor_id)
+                if entry and entry[0] >= now:
+                    found[doctor_id] = entry[1]
+                else:
+                    missing.append(doctor_id)
+        if missing:
+            loaded = load_schedules(db, missing)
+            found.update(loaded)
+            if self.ttl_seconds > 0:
+                with self._lock:
+                    if version == self._version:
+                        expires_at = time.monotonic() + self.ttl_seconds
+                        for doctor_id, schedule in loaded.items():
+                            self._entries[doctor_id] = (expires_at, schedule)
+        return found
+
+    def get(self, db: Session, doctor_id: int) -> WeeklySchedule:
+        return self.get_many(db, [doctor_id])[doctor_id]
+
+    def invalidate(self, doctor_id: int):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(doctor_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+cache = ScheduleCache(config.SCHEDULE_CACHE_TTL_SECONDS)
+
+
+def check_slot(db: Session, doctor_id: int, day: datetime.date, slot: int):
+    """Raise ValueError unless the doctor's schedule offers `slot` on `day`"""
+    if not cache.get(db, doctor_id).offers(day, slot):
+        raise ValueError(f"Slot {slot} is not offered by this doctor on {day.isoformat()}")
@@ -1,7 +1,12 @@
-from pydantic import BaseModel, Field, validator, EmailStr
-from typing import Optional
+from pydantic import BaseModel, Field, root_validator, validator, EmailStr, conlist
+from typing import List, Optional
 import datetime
 
+# schedule limits; a day of the shortest slots bounds the slot number
+MIN_SLOT_MINUTES = 5
+MAX_SLOT_MINUTES = 12 * 60
+MAX_SLOTS_PER_DAY = 24 * 60 // MIN_SLOT_MINUTES
+
 
 class DoctorCreate(BaseModel):
     name: str
@@ -16,6 +21,57 @@ class PatientCreate(BaseModel):
     password: str
 
 
+class _ImportedAccount(BaseModel):
+    """One row of a bulk import (app/bulk_import.py); either a password to hash or an existing argon2 hash"""
+    name: str
+    email: EmailStr
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+
+    @root_validator(skip_on_failure=True)
+    def one_password(cls, values):
+        if not values.get("password") and not values.get("hashed_password"):
+            raise ValueError("password or hashed_password is required")
+        if values.get("hashed_password") and not values["hashed_password"].startswith("$argon2"):
+            raise ValueError("hashed_password must be an argon2 hash")
+        return values
+
+
+class DoctorImportRow(_ImportedAccount):
+    license_number: str
+    is_verified: int = Field(0, ge=0, le=2)
+
+
+class PatientImportRow(_ImportedAccount):
+    pass
+
+
+class AppointmentImportRow(BaseModel):
+    """A historical appointment; doctor and patient by id or by email"""
+    doctor_id: Optional[int] = None
+    doctor_email: Optional[EmailStr] = None
+    patient_id: Optional[int] = None
+    patient_email: Optional[EmailStr] = None
+    date: datetime.date
+    slot: int = Field(..., ge=1, le=MAX_SLOTS_PER_DAY)
+    status: str = "BOOKED"
+    is_rescheduled: int = Field(0, ge=0, le=1)
+    created_at: Optional[datetime.datetime] = None
+
+    @validator("status")
+    def known_status(cls, v):
+        if v not in ("PENDING", "BOOKED", "CANCELLED", "REJECTED"):
+            raise ValueError("status must be one of PENDING, BOOKED, CANCELLED, REJECTED")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def both_parties(cls, values):
+        for party in ("doctor", "patient"):
+            if values.get(f"{party}_id") is None and values.get(f"{party}_email") is None:
+                raise ValueError(f"{party}_id or {party}_email is required")
+        return values
+
+
 class DoctorOut(BaseModel):
     id: int
     name: str
@@ -27,6 +83,12 @@ class DoctorOut(BaseModel):
         orm_mode = True
 
 
+class DirectoryDoctor(BaseModel):
+    id: int
+    name: str
+    email: EmailStr
+
+
 class PatientOut(BaseModel):
     id: int
     name: str
@@ -40,7 +102,18 @@ class AppointmentCreate(BaseModel):
     doctor_id: int
     patient_id: int
     date: datetime.date
-    slot: int = Field(..., ge=1, le=4)
+    slot: int = Field(..., ge=1, le=MAX_SLOTS_PER_DAY)
+
+    @validator("date")
+    def no_past_dates(cls, v):
+        if v < datetime.date.today():
+            raise ValueError("date cannot be in the past")
+        return v
+
+
+class VisitSlot(BaseModel):
+    date: datetime.date
+    slot: int = Field(..., ge=1, le=MAX_SLOTS_PER_DAY)
 
     @validator("date")
     def no_past_dates(cls, v):
@@ -49,6 +122,31 @@ class AppointmentCreate(BaseModel):
         return v
 
 
+class BulkBookRequest(BaseModel):
+    doctor_id: int
+    patient_id: int
+    visits: conlist(VisitSlot, min_items=1, max_items=50)
+
+
+class BulkBookResult(BaseModel):
+    date: datetime.date
+    slot: int
+    ok: bool
+    appointment_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkStatusRequest(BaseModel):
+    appointment_ids: conlist(int, min_items=1, max_items=200)
+
+
+class BulkStatusResult(BaseModel):
+    appointment_id: int
+    ok: bool
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+
 class AppointmentOut(BaseModel):
     id: int
     doctor_id: int
@@ -62,14 +160,212 @@ class AppointmentOut(BaseModel):
         orm_mode = True
 
 
+class LiveAppointmentOut(AppointmentOut):
+    # the slot's times under the doctor's schedule; None once the day no longer offers the slot
+    start: Optional[datetime.time] = None
+    end: Optional[datetime.time] = None
+
+
+class AppointmentPage(BaseModel):
+    items: List[LiveAppointmentOut]
+    next_cursor: Optional[str] = None
+
+
+class ArchivedAppointmentOut(AppointmentOut):
+    archived_at: datetime.datetime
+
+
+class ArchivedAppointmentPage(BaseModel):
+    items: List[ArchivedAppointmentOut]
+    next_cursor: Optional[str] = None
+
+
 class SlotStatus(BaseModel):
     slot: int
+    start: datetime.time
+    end: datetime.time
     available: bool
     appointment_id: Optional[int] = None
     patient_id: Optional[int] = None
 
-    class Config:
-        orm_mode = True
+
+class DoctorAvailability(BaseModel):
+    date: datetime.date
+    doctor_id: int
+    slots: List[SlotStatus]
+
+
+class DoctorGridRow(BaseModel):
+    doctor_id: int
+    # one bitmap per day in the range, as a hex string (up to MAX_SLOTS_PER_DAY bits, too wide for a JSON
+    # number); bit (slot - 1) is set when the slot is taken
+    booked: List[str]
+    # same layout; bit (slot - 1) is set when the doctor's schedule offers the slot that day
+    open: List[str]
+
+
+class AvailabilityGrid(BaseModel):
+    start: datetime.date
+    end: datetime.date
+    # the most slots any listed doctor offers on any day of the range
+    slots_per_day: int
+    doctors: List[DoctorGridRow]
+
+
+class SummaryRow(BaseModel):
+    date: datetime.date  # the day, or the Monday of the week
+    days: int
+    offered: int  # slots the schedule offers
+    pending: int = 0
+    booked: int = 0
+    cancelled: int = 0
+    rejected: int = 0
+    # share of offered slots held by pending or booked appointments
+    utilization: float
+
+
+class ScheduleSummary(BaseModel):
+    doctor_id: int
+    start: datetime.date
+    end: datetime.date
+    group: str
+    rows: List[SummaryRow]
+    totals: SummaryRow
+
+
+class AnalyticsRow(BaseModel):
+    offered: int  # slots the doctors' schedules offer over the range
+    pending: int
+    booked: int
+    cancelled: int
+    rejected: int
+    utilization: float  # (pending + booked) / offered
+    cancel_rate: float  # share of all appointments
+    reject_rate: float
+    # mean days from booking to appointment date; None without created_at data
+    avg_lead_days: Optional[float] = None
+
+
+class DoctorAnalytics(AnalyticsRow):
+    doctor_id: int
+
+
+class SlotLoad(BaseModel):
+    weekday: int  # 0 = Monday
+    slot: int
+    appointments: int  # pending or booked
+
+
+class AdminAnalytics(BaseModel):
+    start: datetime.date
+    end: datetime.date
+    totals: AnalyticsRow
+    doctors: List[DoctorAnalytics]
+    busiest_slots: List[SlotLoad]
+
+
+class SlotWindow(BaseModel):
+    slot: int
+    start: datetime.time
+    end: datetime.time
+
+
+class FreeSlotsDay(BaseModel):
+    date: datetime.date
+    slots: List[SlotWindow]
+
+
+class FreeSlots(BaseModel):
+    doctor_id: int
+    start: datetime.date
+    end: datetime.date
+    days: List[FreeSlotsDay]
+
+
+class OpenSlot(BaseModel):
+    doctor_id: int
+    date: datetime.date
+    slot: int
+    start: datetime.time
+    end: datetime.time
+
+
+class NextAvailable(BaseModel):
+    # earliest free slots in (date, start time, doctor_id) order
+    slots: List[OpenSlot]
+    # last date examined; fewer than `limit` slots means nothing else is free up to here
+    searched_until: datetime.date
+
+
+class ScheduleBreak(BaseModel):
+    start: datetime.time
+    end: datetime.time
+
+    @validator("end")
+    def end_after_start(cls, v, values):
+        if "start" in values and v <= values["start"]:
+            raise ValueError("end must be after start")
+        return v
+
+
+class WeekdaySchedule(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = Monday
+    start: datetime.time
+    end: datetime.time
+    slot_minutes: int = Field(..., ge=MIN_SLOT_MINUTES, le=MAX_SLOT_MINUTES)
+    breaks: List[ScheduleBreak] = []
+
+    @validator("end")
+    def end_after_start(cls, v, values):
+        if "start" in values and v <= values["start"]:
+            raise ValueError("end must be after start")
+        return v
+
+
+class WeeklyScheduleIn(BaseModel):
+    # an empty list drops the template and restores the default four slots a day
+    days: conlist(WeekdaySchedule, max_items=7)
+
+    @validator("days")
+    def one_entry_per_weekday(cls, v):
+        if len({d.weekday for d in v}) != len(v):
+            raise ValueError("each weekday may appear only once")
+        return v
+
+
+class ScheduleExceptionIn(BaseModel):
+    date: datetime.date
+    closed: bool = False
+    # unset fields keep the regular template's value for that weekday
+    start: Optional[datetime.time] = None
+    end: Optional[datetime.time] = None
+    slot_minutes: Optional[int] = Field(None, ge=MIN_SLOT_MINUTES, le=MAX_SLOT_MINUTES)
+
+
+class ScheduleException(BaseModel):
+    date: datetime.date
+    closed: bool
+    start: Optional[datetime.time] = None
+    end: Optional[datetime.time] = None
+    slot_minutes: Optional[int] = None
+
+
+class ScheduleOut(BaseModel):
+    doctor_id: int
+    # True while the doctor has no weekly template and offers the default four slots every day
+    default: bool
+    days: List[WeekdaySchedule]
+    exceptions: List[ScheduleException]
+
+
+class Message(BaseModel):
+    message: str
+
+
+class OccupancyCheck(BaseModel):
+    consistent: bool
+    problems: List[str]
+    problem_count: int
 
 
 class Token(BaseModel):
@@ -0,0 +1,133 @@
+"""Concurrent booking stress test: many threads race for the same slots.
+
+Runs crud.create_appointment against a throwaway SQLite database (tuned with
+the same profile as the app) and reports throughput, how each attempt ended,
+and whether any doctor slot or patient slot ended up double-booked.
+
+    python -m benchmarks.booking_stress --threads 16 --attempts 4000
+"""
+import argparse
+import collections
+import datetime
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, database, models, schemas
+
+
+def seed(engine, doctors, patients):
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(models.Doctor.__table__.insert(), [
+            {"id": d, "name": f"Doctor {d}", "email": f"doctor{d}@bench.local", "hashed_password": "x",
+             "license_number": f"LIC-{d}", "is_verified": 1, "created_at": now}
+            for d in range(1, doctors + 1)
+        ])
+        conn.execute(models.Patient.__table__.insert(), [
+            {"id": p, "name": f"Patient {p}", "email": f"patient{p}@bench.local", "hashed_password": "x",
+             "created_at": now}
+            for p in range(1, patients + 1)
+        ])
+
+
+def double_bookings(engine):
+    table = models.Appointment.__table__
+    found = {}
+    with engine.connect() as conn:
+        for owner in ("doctor_id", "patient_id"):
+            query = (
+                table.select()
+                .with_only_columns(table.c[owner], table.c.date, table.c.slot, func.count())
+                .group_by(table.c[owner], table.c.date, table.c.slot)
+                .having(func.count() > 1)
+            )
+            found[owner] = conn.execute(query).all()
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=4000, help="total booking attempts across all threads")
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--days", type=int, default=5, help="days to spread bookings over (smaller = more contention)")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **database.engine_options(url))
+    database.apply_profile(engine, url)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    try:
+        models.Base.metadata.create_all(bind=engine)
+        seed(engine, args.doctors, args.patients)
+
+        start_day = datetime.date.today() + datetime.timedelta(days=1)
+        outcomes = collections.Counter()
+        lock = threading.Lock()
+        per_thread = args.attempts // args.threads
+        barrier = threading.Barrier(args.threads)
+
+        def worker(seed_value):
+            rng = random.Random(seed_value)
+            local = collections.Counter()
+            db = Session()
+            barrier.wait()
+            try:
+                for _ in range(per_thread):
+                    appt_in = schemas.AppointmentCreate(
+                        doctor_id=rng.randint(1, args.doctors),
+                        patient_id=rng.randint(1, args.patients),
+                        date=start_day + datetime.timedelta(days=rng.randrange(args.days)),
+                        slot=rng.randint(1, 4),
+                    )
+                    try:
+                        crud.create_appointment(db, appt_in)
+                        local["booked"] += 1
+                    except crud.BookingConflict as e:
+                        local[e.constraint] += 1
+            finally:
+                db.close()
+            with lock:
+                outcomes.update(local)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        attempts = per_thread * args.threads
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM appointments")).scalar()
+        duplicates = double_bookings(engine)
+
+        print(f"{attempts} attempts from {args.threads} threads in {elapsed:.2f}s ({attempts / elapsed:.0f} attempts/s)")
+        for outcome, count in sorted(outcomes.items()):
+            print(f"  {outcome}: {count}")
+        print(f"rows in appointments: {rows} (booked outcomes: {outcomes['booked']})")
+        print(f"double-booked doctor slots: {len(duplicates['doctor_id'])}")
+        print(f"double-booked patient slots: {len(duplicates['patient_id'])}")
+        if rows != outcomes["booked"] or any(duplicates.values()):
+            raise SystemExit("FAILED: booking invariants violated")
+        print("OK: zero double bookings")
+    finally:
+        engine.dispose()
+        os.remove(path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""In-process load test: bulk-seed a throwaway database, drive a mixed workload, report latency.
+
+Seeds doctors, patients and appointments with executemany INSERTs (every
+account shares one precomputed argon2 hash, so seeding is not hash-bound),
+then runs the app in this process behind httpx's ASGI transport with
+--concurrency virtual users issuing a weighted mix of login, availability,
+book, approve and reschedule requests. p50/p95/p99 latency, throughput and
+status codes per endpoint go to a JSON file for comparing runs.
+
+    python -m benchmarks.load_test --doctors 200 --patients 5000 --appointments 50000 \\
+        --requests 5000 --concurrency 32 --output load_test.json
+
+The database is a temporary SQLite file (appointments.db is never touched)
+unless --database-url is given. Settings such as OCCUPANCY_INDEX or
+AUTH_MODE are read from the environment as usual.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DEFAULT_MIX = "login=5,availability=50,book=25,approve=10,reschedule=10"
+PASSWORD = "bench-password"
+
+
+def parse_mix(raw):
+    mix = {}
+    for part in raw.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = int(weight)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"unknown operations in --mix: {sorted(unknown)}")
+    return mix
+
+
+def seed(engine, args, hashed_password):
+    """Doctors, patients and appointments over the next --days days, all via executemany"""
+    from app import models
+
+    now = datetime.datetime.utcnow()
+    today = datetime.date.today()
+    rng = random.Random(args.seed)
+    with engine.begin() as conn:
+        conn.execute(models.Doctor.__table__.insert(), [
+            {"id": d, "name": f"Doctor {d}", "email": f"doctor{d}@bench.local", "hashed_password": hashed_password,
+             "license_number": f"LIC-{d}", "is_verified": 1, "created_at": now}
+            for d in range(1, args.doctors + 1)
+        ])
+        conn.execute(models.Patient.__table__.insert(), [
+            {"id": p, "name": f"Patient {p}", "email": f"patient{p}@bench.local", "hashed_password": hashed_password,
+             "created_at": now}
+            for p in range(1, args.patients + 1)
+        ])
+
+        # distinct (doctor, date, slot) cells with a patient not yet booked at that (date, slot)
+        taken_doctor, taken_patient, rows = set(), set(), []
+        capacity = args.doctors * args.days * 4
+        target = min(args.appointments, capacity // 2)
+        while len(rows) < target:
+            doctor_id = rng.randint(1, args.doctors)
+            day = today + datetime.timedelta(days=rng.randrange(args.days))
+            slot = rng.randint(1, 4)
+            patient_id = rng.randint(1, args.patients)
+            if (doctor_id, day, slot) in taken_doctor or (patient_id, day, slot) in taken_patient:
+                continue
+            taken_doctor.add((doctor_id, day, slot))
+            taken_patient.add((patient_id, day, slot))
+            rows.append({"id": len(rows) + 1, "doctor_id": doctor_id, "patient_id": patient_id, "date": day, "slot": slot,
+                         "status": rng.choice(("PENDING", "BOOKED")), "is_rescheduled": 0, "created_at": now})
+        for i in range(0, len(rows), 10000):
+            conn.execute(models.Appointment.__table__.insert(), rows[i:i + 10000])
+    return rows
+
+
+class Workload:
+    """Shared state of the virtual users: tokens and appointments known to be pending / booked"""
+
+    def __init__(self, client, args, rng, seeded):
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.today = datetime.date.today()
+        self.patient_tokens = {}
+        self.doctor_tokens = {}
+        # (appointment_id, doctor_id, patient_id); the seeded future appointments start the queues
+        self.pending = collections.deque()
+        self.booked = collections.deque()
+        for row in seeded:
+            if row["date"] > self.today:
+                queue = self.pending if row["status"] == "PENDING" else self.booked
+                queue.append((row["id"], row["doctor_id"], row["patient_id"]))
+        rng.shuffle(self.pending)
+        rng.shuffle(self.booked)
+
+    def random_day(self):
+        return self.today + datetime.timedelta(days=self.rng.randrange(1, self.args.days))
+
+    def token_for(self, role, user_id):
+        """Headers for a user; minted like /token does, so only the login operation pays for argon2"""
+        from app.auth import create_access_token
+
+        tokens = self.doctor_tokens if role == "doctor" else self.patient_tokens
+        if user_id not in tokens:
+            token = create_access_token(data={
+                "sub": f"{role}{user_id}@bench.local", "role": role, "id": user_id,
+                "is_verified": 1, "name": f"{role.title()} {user_id}",
+            })
+            tokens[user_id] = {"Authorization": f"Bearer {token}"}
+        return tokens[user_id]
+
+
+async def op_login(w):
+    role, count = ("doctor", w.args.doctors) if w.rng.random() < 0.5 else ("patient", w.args.patients)
+    return await w.client.post(
+        "/token", data={"username": f"{role}{w.rng.randint(1, count)}@bench.local", "password": PASSWORD}
+    )
+
+
+async def op_availability(w):
+    doctor_id = w.rng.randint(1, w.args.doctors)
+    return await w.client.get(f"/doctors/{doctor_id}/availability", params={"date": w.random_day().isoformat()})
+
+
+async def op_book(w):
+    patient_id = w.rng.randint(1, w.args.patients)
+    doctor_id = w.rng.randint(1, w.args.doctors)
+    headers = w.token_for("patient", patient_id)
+    response = await w.client.post("/appointments/book", headers=headers, json={
+        "doctor_id": doctor_id, "patient_id": patient_id,
+        "date": w.random_day().isoformat(), "slot": w.rng.randint(1, 4),
+    })
+    if response.status_code == 200:
+        w.pending.append((response.json()["id"], doctor_id, patient_id))
+    return response
+
+
+async def op_approve(w):
+    if not w.pending:
+        return await op_book(w)
+    appointment_id, doctor_id, patient_id = w.pending.popleft()
+    headers = w.token_for("doctor", doctor_id)
+    response = await w.client.post(f"/appointments/{appointment_id}/approve", headers=headers)
+    if response.status_code == 200:
+        w.booked.append((appointment_id, doctor_id, patient_id))
+    return response
+
+
+async def op_reschedule(w):
+    if not w.booked:
+        return await op_approve(w)
+    appointment_id, doctor_id, patient_id = w.booked.popleft()
+    headers = w.token_for("patient", patient_id)
+    response = await w.client.post(
+        f"/appointments/{appointment_id}/reschedule", headers=headers,
+        params={"new_date": w.random_day().isoformat(), "new_slot": w.rng.randint(1, 4)},
+    )
+    if response.status_code == 200:
+        w.pending.append((appointment_id, doctor_id, patient_id))
+    else:
+        w.booked.append((appointment_id, doctor_id, patient_id))
+    return response
+
+
+OPERATIONS = {
+    "login": op_login,
+    "availability": op_availability,
+    "book": op_book,
+    "approve": op_approve,
+    "reschedule": op_reschedule,
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """samples: {endpoint: [(seconds, status_code), ...]}"""
+    report = {}
+    for endpoint, entries in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in entries)
+        report[endpoint] = {
+            "requests": len(entries),
+            "throughput_rps": round(len(entries) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "max_ms": round(latencies[-1], 2),
+            "status_codes": dict(sorted(collections.Counter(str(code) for _, code in entries).items())),
+        }
+    return report
+
+
+async def run(args, mix, seeded):
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    rng = random.Random(args.seed)
+    samples = collections.defaultdict(list)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    remaining = args.requests
+
+    # app errors come back as 500 responses and are counted, they do not stop the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        workload = Workload(client, args, rng, seeded)
+
+        async def user():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                response = await OPERATIONS[name](workload)
+                # recorded under the request actually sent: approve/reschedule fall back to
+                # book/approve while their queues are empty
+                samples[endpoint_name(response.request.url.path)].append(
+                    (time.perf_counter() - started, response.status_code)
+                )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await app.router.shutdown()
+    return samples, elapsed
+
+
+def endpoint_name(path):
+    if path == "/token":
+        return "login"
+    if path == "/appointments/book":
+        return "book"
+    return path.rsplit("/", 1)[-1]  # availability, approve, reschedule
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--appointments", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=60, help="seeded appointments and requests fall in this window")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="run against this database instead of a temporary SQLite file")
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    path = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    # the app reads DATABASE_URL at import time, so nothing from app is imported before this point
+    from app import crud, database, migrations, models
+
+    try:
+        models.Base.metadata.create_all(bind=database.engine)
+        migrations.upgrade(database.engine)
+        started = time.perf_counter()
+        seeded = seed(database.engine, args, crud.get_password_hash(PASSWORD))
+        seed_seconds = time.perf_counter() - started
+        print(f"seeded {args.doctors} doctors, {args.patients} patients, {len(seeded)} appointments "
+              f"in {seed_seconds:.2f}s", flush=True)
+
+        samples, elapsed = asyncio.run(run(args, mix, seeded))
+        total = sum(len(v) for v in samples.values())
+        endpoints = summarize(samples, elapsed)
+        result = {
+            "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": sys.version.split()[0],
+            "params": {k: v for k, v in vars(args).items() if k not in ("database_url", "output")},
+            "database": "sqlite (temporary)" if path else database.engine.url.get_backend_name(),
+            "seed_seconds": round(seed_seconds, 2),
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 1),
+            "endpoints": endpoints,
+        }
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+        print(f"{total} requests, concurrency {args.concurrency}, {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+        print(f"{'endpoint':<14}{'count':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}  status codes")
+        for name, stats in endpoints.items():
+            print(f"{name:<14}{stats['requests']:>7}{stats['throughput_rps']:>8}{stats['p50_ms']:>9}"
+                  f"{stats['p95_ms']:>9}{stats['p99_ms']:>9}  {stats['status_codes']}")
+        print(f"written to {args.output}")
+    finally:
+        database.engine.dispose()
+        if path:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Check the number of SQL statements each endpoint issues against a fixed budget.
+
+Runs every scenario once against a throwaway SQLite database with warm caches
+(principal, schedule) and reads the statement count from the Server-Timing
+header the request instrumentation adds. Exits with status 1 when an endpoint
+goes over its budget, so it can gate changes to the write paths.
+
+    python -m benchmarks.query_budget
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+
+PASSWORD = "budget-password"
+
+# statements per request with warm caches; BEGIN/COMMIT are not cursor executions and are not counted
+BUDGETS = {
+    "register doctor": 2,  # duplicate check, INSERT
+    "register patient": 2,  # duplicate check, INSERT
+    "login": 1,
+    "list doctors": 0,  # cached body
+    "availability": 2,  # doctor exists, booked slots (0 with OCCUPANCY_INDEX=1)
+    # the analytics rollup deltas go in as one executemany upsert per rollup table that changes
+    "book": 3,  # INSERT, daily and slot rollup upserts
+    "approve": 3,  # load, guarded UPDATE, daily rollup upsert (pending -> booked leaves the slot rollup alone)
+    "reject": 5,  # load, guarded INSERT ... SELECT into the archive, guarded DELETE, daily and slot rollup upserts
+    "reschedule": 4,  # load, guarded UPDATE, daily and slot rollup upserts
+    "doctor cancel": 5,
+    "patient cancel": 5,
+    "verify doctor": 1,  # UPDATE
+    "patient feed": 1,
+    "doctor summary": 1,  # a range scan of the daily rollup
+}
+
+
+def server_timing_queries(response):
+    header = response.headers["server-timing"]
+    return int(header.split('desc="', 1)[1].split(" ", 1)[0])
+
+
+async def run_scenarios(client, tokens, day):
+    """Yield (name, response) for every scenario, each on state set up by the previous ones"""
+    doctor, patient, other_patient, admin = tokens
+
+    async def book(headers, patient_id, slot):
+        return await client.post("/appointments/book", headers=headers, json={
+            "doctor_id": 1, "patient_id": patient_id, "date": day.isoformat(), "slot": slot,
+        })
+
+    # warm the principal and schedule caches and the directory body
+    await client.get("/patients/me/appointments", headers=patient)
+    await client.get("/patients/me/appointments", headers=other_patient)
+    await client.get("/doctors/me/appointments", headers=doctor)
+    await client.get("/doctors/1/availability", params={"date": day.isoformat()})
+    await client.get("/doctors")
+
+    yield "register doctor", await client.post("/doctors/register", json={
+        "name": "New Doctor", "email": "new-doctor@example.com", "password": PASSWORD, "license_number": "LIC-NEW",
+    })
+    yield "register patient", await client.post("/patients", json={
+        "name": "New Patient", "email": "new-patient@example.com", "password": PASSWORD,
+    })
+    yield "login", await client.post("/token", data={"username": "patient1@example.com", "password": PASSWORD})
+    yield "list doctors", await client.get("/doctors")
+    yield "availability", await client.get("/doctors/1/availability", params={"date": day.isoformat()})
+
+    response = await book(patient, 1, 1)
+    first = response.json()["id"]
+    yield "book", response
+    yield "approve", await client.post(f"/appointments/{first}/approve", headers=doctor)
+    yield "reschedule", await client.post(
+        f"/appointments/{first}/reschedule", headers=patient,
+        params={"new_date": day.isoformat(), "new_slot": 2},
+    )
+    await client.post(f"/appointments/{first}/approve", headers=doctor)
+    yield "patient cancel", await client.post(f"/appointments/{first}/patient-cancel", headers=patient)
+
+    second = (await book(other_patient, 2, 3)).json()["id"]
+    yield "doctor cancel", await client.delete(f"/appointments/{second}", headers=doctor)
+    third = (await book(other_patient, 2, 4)).json()["id"]
+    yield "reject", await client.post(f"/appointments/{third}/reject", headers=doctor)
+
+    # before verify doctor, which drops the doctor's cached principal
+    yield "doctor summary", await client.get("/doctors/me/summary", headers=doctor, params={
+        "start": day.isoformat(), "end": (day + datetime.timedelta(days=6)).isoformat(),
+    })
+    yield "verify doctor", await client.put("/admin/verify-doctor/1", headers=admin)
+    yield "patient feed", await client.get("/patients/me/appointments", headers=patient)
+
+
+def seed(patients=(1, 2)):
+    """The accounts the scenarios use: verified doctor 1 and the given patient ids"""
+    from app import crud, database, models
+
+    hashed_password = crud.get_password_hash(PASSWORD)
+    with database.engine.begin() as conn:
+        conn.execute(models.Doctor.__table__.insert(), [{
+            "id": 1, "name": "Doctor 1", "email": "doctor1@example.com", "hashed_password": hashed_password,
+            "license_number": "LIC-1", "is_verified": 1,
+        }])
+        conn.execute(models.Patient.__table__.insert(), [
+            {"id": p, "name": f"Patient {p}", "email": f"patient{p}@example.com", "hashed_password": hashed_password}
+            for p in patients
+        ])
+
+
+def account_headers(patients=(1, 2)) -> dict:
+    """Bearer headers for the seeded accounts, keyed doctor, patient<id> and admin"""
+    from app.auth import create_access_token
+
+    def headers(role, user_id, email):
+        token = create_access_token(data={"sub": email, "role": role, "id": user_id, "is_verified": 1})
+        return {"Authorization": f"Bearer {token}"}
+
+    return {
+        "doctor": headers("doctor", 1, "doctor1@example.com"),
+        **{f"patient{p}": headers("patient", p, f"patient{p}@example.com") for p in patients},
+        "admin": headers("admin", 0, "admin@example.com"),
+    }
+
+
+def booking_day() -> datetime.date:
+    """A week ahead: the legacy template offers slots 1-4 on every day, and none of them has started"""
+    return datetime.date.today() + datetime.timedelta(days=7)
+
+
+async def measure():
+    import httpx
+    from app import config
+    from app.main import app
+
+    config.SERVER_TIMING = True
+    accounts = account_headers()
+    tokens = (accounts["doctor"], accounts["patient1"], accounts["patient2"], accounts["admin"])
+    day = booking_day()
+
+    await app.router.startup()
+    counts = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://budget") as client:
+            async for name, response in run_scenarios(client, tokens, day):
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name}: HTTP {response.status_code} {response.text}")
+                counts[name] = server_timing_queries(response)
+    finally:
+        await app.router.shutdown()
+    return counts
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    # the app reads DATABASE_URL at import time, so nothing from app is imported before this point
+    from app import database, migrations, models
+
+    try:
+        models.Base.metadata.create_all(bind=database.engine)
+        migrations.upgrade(database.engine)
+        seed()
+        counts = asyncio.run(measure())
+    finally:
+        database.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    over = []
+    print(f"{'endpoint':<18}{'queries':>9}{'budget':>8}")
+    for name, budget in BUDGETS.items():
+        count = counts[name]
+        print(f"{name:<18}{count:>9}{budget:>8}{'  OVER' if count > budget else ''}")
+        if count > budget:
+            over.append(name)
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        sys.exit(1)
+    print("all endpoints within budget")
+
+
+if __name__ == "__main__":
+    main()
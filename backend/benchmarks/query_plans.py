@@ -0,0 +1,164 @@
+"""Show EXPLAIN QUERY PLAN and timings for the appointment access paths, before and after the index set.
+
+Builds a throwaway SQLite database (appointments.db is never touched), loads it
+with synthetic appointments, drops the secondary indexes to get the "before"
+picture, then applies `migrations.create_missing_indexes` and measures again.
+Each access path is the crud function the endpoints call: its statements are
+captured as executed and explained with their bound parameters, and the
+timing covers the whole call, ORM loading included.
+
+    python -m benchmarks.query_plans --doctors 200 --days 365
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app import analytics, archive, crud, migrations, models
+
+ACCESS_PATHS = {
+    "availability (doctor, date)":
+        lambda db, p: crud.get_appointments_for_doctor_date(db, p["doctor_id"], p["day"]),
+    "grid / free slots (doctors, date range)":
+        lambda db, p: crud.get_booked_slots_for_doctors_range(db, [p["doctor_id"]], p["day"], p["day_end"]),
+    "doctor feed page (doctor)":
+        lambda db, p: crud.list_appointments_page(db, doctor_id=p["doctor_id"]),
+    "patient feed page (patient)":
+        lambda db, p: crud.list_appointments_page(db, patient_id=p["patient_id"]),
+    "doctor summary (doctor, date range)":
+        lambda db, p: crud.count_appointments_by_day(db, p["doctor_id"], p["day"], p["day_end"]),
+    "archiver backlog":
+        lambda db, p: archive.count_archivable(db, archive.default_cutoff()),
+}
+
+
+def seed(engine, doctors, patients, days):
+    start = datetime.date.today() - datetime.timedelta(days=days - 30)
+    now = datetime.datetime.utcnow()
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(
+            models.Doctor.__table__.insert(),
+            [
+                {"id": d, "name": f"Doctor {d}", "email": f"doctor{d}@bench.local", "hashed_password": "x",
+                 "license_number": f"LIC-{d}", "is_verified": 1, "created_at": now}
+                for d in range(1, doctors + 1)
+            ],
+        )
+        conn.execute(
+            models.Patient.__table__.insert(),
+            [
+                {"id": p, "name": f"Patient {p}", "email": f"patient{p}@bench.local", "hashed_password": "x",
+                 "created_at": now}
+                for p in range(1, patients + 1)
+            ],
+        )
+        rows = []
+        for offset in range(days):
+            day = start + datetime.timedelta(days=offset)
+            status = "PENDING" if day >= datetime.date.today() else None
+            for d in range(1, doctors + 1):
+                for slot in range(1, 5):
+                    # distinct doctors at the same (date, slot) always map to distinct patients
+                    patient_id = (d + offset * 7 + slot) % patients + 1
+                    rows.append({
+                        "doctor_id": d, "patient_id": patient_id, "date": day, "slot": slot, "created_at": now,
+                        "status": status or rng.choice(("BOOKED", "BOOKED", "BOOKED", "CANCELLED", "REJECTED")),
+                        "is_rescheduled": 0,
+                    })
+            if len(rows) >= 50_000:
+                conn.execute(models.Appointment.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.Appointment.__table__.insert(), rows)
+        conn.execute(text("ANALYZE"))
+
+
+def captured_statements(engine, call, params):
+    """Run call once and return the (statement, parameters) it sent to the database"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with Session(engine) as db:
+            call(db, params)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def measure(engine, params, repeat):
+    results = {}
+    for name, call in ACCESS_PATHS.items():
+        plan = []
+        with engine.connect() as conn:
+            for statement, parameters in captured_statements(engine, call, params):
+                plan.extend(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+        with Session(engine) as db:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                call(db, params)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+        results[name] = (plan, elapsed_ms)
+    return results
+
+
+def report(label, results):
+    print(f"\n=== {label} ===")
+    for name, (plan, elapsed_ms) in results.items():
+        print(f"{name}: {elapsed_ms:.3f} ms")
+        for line in plan:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        models.Base.metadata.create_all(bind=engine)
+        # start from the pre-index schema: only the primary key and the two unique constraints
+        with engine.begin() as conn:
+            for index in models.Appointment.__table__.indexes:
+                if index.name != "ix_appointments_id":
+                    conn.execute(text(f"DROP INDEX {index.name}"))
+
+        seed(engine, args.doctors, args.patients, args.days)
+        # the seed writes behind the app's back; the doctor summary reads the rollups
+        with Session(engine) as db:
+            analytics.rebuild(db)
+        total = args.doctors * args.days * 4
+        print(f"seeded {total} appointments ({args.doctors} doctors x {args.days} days x 4 slots)")
+
+        today = datetime.date.today()
+        params = {
+            "doctor_id": args.doctors // 2,
+            "patient_id": args.patients // 2,
+            "day": today,
+            "day_end": today + datetime.timedelta(days=14),
+        }
+        report("before", measure(engine, params, args.repeat))
+        print(f"\ncreated indexes: {migrations.create_missing_indexes(engine)}")
+        report("after", measure(engine, params, args.repeat))
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
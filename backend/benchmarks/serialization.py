@@ -0,0 +1,103 @@
+"""Serialization cost of an appointment feed page, per 1,000 appointments.
+
+Compares the three ways a handler can turn appointments into a response body:
+
+- orm + jsonable_encoder: full entities, no response_model (what the feeds did
+  originally; jsonable_encoder walks every mapped attribute), json.dumps
+- orm + response_model: full entities validated into AppointmentPage, then
+  jsonable_encoder and json.dumps, as FastAPI does for a declared response_model
+- rows + orjson: the column projection crud uses now, handed to orjson directly
+
+Each variant is timed with and without the query that loads the rows, against
+a throwaway in-memory SQLite database.
+
+    python -m benchmarks.serialization --appointments 1000 --repeat 50
+"""
+import argparse
+import datetime
+import json
+import statistics
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import crud, models, schemas
+
+
+def seed(engine, appointments):
+    today = datetime.date.today()
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Appointment), [
+            dict(doctor_id=1 + i % 20, patient_id=1 + i, date=today + datetime.timedelta(days=i // 80),
+                 slot=1 + (i // 20) % 4, status="PENDING", is_rescheduled=0, created_at=now)
+            for i in range(appointments)
+        ])
+
+
+def load_entities(db):
+    db.expunge_all()
+    return db.query(models.Appointment).order_by(models.Appointment.id).all()
+
+
+def load_rows(db):
+    return db.query(*crud.APPOINTMENT_COLUMNS).order_by(models.Appointment.id).all()
+
+
+def via_jsonable_encoder(items):
+    return json.dumps({"items": jsonable_encoder(items), "next_cursor": None}).encode()
+
+
+def via_response_model(items):
+    page = schemas.AppointmentPage(items=items, next_cursor=None)
+    return json.dumps(jsonable_encoder(page)).encode()
+
+
+def via_orjson(items):
+    return orjson.dumps({"items": [row._asdict() for row in items], "next_cursor": None})
+
+
+VARIANTS = {
+    "orm + jsonable_encoder": (load_entities, via_jsonable_encoder),
+    "orm + response_model": (load_entities, via_response_model),
+    "rows + orjson": (load_rows, via_orjson),
+}
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--appointments", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    seed(engine, args.appointments)
+    per_1000 = 1000 / args.appointments
+
+    print(f"{args.appointments} appointments, median of {args.repeat} runs, ms per 1,000 appointments")
+    print(f"{'variant':<26}{'serialize':>12}{'load+serialize':>16}{'bytes':>10}")
+    with Session(engine) as db:
+        for name, (load, serialize) in VARIANTS.items():
+            items = load(db)
+            body = serialize(items)
+            serialize_ms = timed(lambda: serialize(items), args.repeat) * 1000 * per_1000
+            total_ms = timed(lambda: serialize(load(db)), args.repeat) * 1000 * per_1000
+            print(f"{name:<26}{serialize_ms:>12.2f}{total_ms:>16.2f}{len(body):>10}")
+
+
+if __name__ == "__main__":
+    main()
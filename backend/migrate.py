@@ -0,0 +1,12 @@
+from app import database, models, migrations
+
+
+def migrate():
+    # new tables first, then in-place changes to existing ones
+    models.Base.metadata.create_all(bind=database.engine)
+    for step, result in migrations.upgrade(database.engine).items():
+        print(f"{step}: {result or 'nothing to do'}")
+
+
+if __name__ == "__main__":
+    migrate()
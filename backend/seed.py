@@ -7,10 +7,14 @@ def seed():
     # create tables
     models.Base.metadata.create_all(bind=database.engine)
 
-    # add some doctors
-    doctors = [("Dr. Alice", "alice@example.com", "pass123"), ("Dr. Bob", "bob@example.com", "pass123"), ("Dr. Carol", "carol@example.com", "pass123")]
-    for name, email, pwd in doctors:
-        u = schemas.DoctorCreate(name=name, email=email, password=pwd)
+    # add some doctors (for real onboarding volumes use `python -m app.bulk_import`)
+    doctors = [
+        ("Dr. Alice", "alice@example.com", "pass123", "LIC-ALICE"),
+        ("Dr. Bob", "bob@example.com", "pass123", "LIC-BOB"),
+        ("Dr. Carol", "carol@example.com", "pass123", "LIC-CAROL"),
+    ]
+    for name, email, pwd, license_number in doctors:
+        u = schemas.DoctorCreate(name=name, email=email, password=pwd, license_number=license_number)
         try:
             crud.create_doctor(db, u)
         except ValueError:
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+import pytest
+
+# the app reads its settings at import time: a throwaway database and no background archiver
+_fd, DB_PATH = tempfile.mkstemp(suffix=".db")
+os.close(_fd)
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import auth, database, main, models, schedules  # noqa: E402
+from benchmarks import query_budget  # noqa: E402
+
+PATIENTS = (1, 2, 3)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    database.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Every test starts from empty tables and cold caches"""
+    database.engine.dispose()
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    auth.principal_cache.clear()
+    schedules.cache.clear()
+    main.doctor_directory.invalidate()
+    yield
+
+
+@pytest.fixture
+def db():
+    with database.SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def accounts():
+    """Verified doctor 1 and patients 1-3 (benchmarks.query_budget's accounts); returns their auth headers"""
+    query_budget.seed(PATIENTS)
+    return query_budget.account_headers(PATIENTS)
+
+
+@pytest.fixture
+def day():
+    return query_budget.booking_day()
+
+
+@pytest.fixture
+def book(client, accounts):
+    """book(patient_id, day, slot) as that patient, with doctor 1"""
+    def book(patient_id, day, slot):
+        return client.post("/appointments/book", headers=accounts[f"patient{patient_id}"], json={
+            "doctor_id": 1, "patient_id": patient_id, "date": day.isoformat(), "slot": slot,
+        })
+    return book
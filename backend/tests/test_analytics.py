@@ -0,0 +1,113 @@
+import datetime
+import re
+
+from sqlalchemy import event, select
+
+from app import analytics, archive, crud, database, models, schemas
+
+
+def all_appointments(db):
+    """(id, doctor_id, date, slot, status, created_at) of every live and archived row"""
+    rows = []
+    for model in (models.Appointment, models.AppointmentArchive):
+        rows += db.execute(select(model.id, *analytics.source_rows(model).selected_columns)).all()
+    return rows
+
+
+def expected_totals(rows, start, end):
+    counts = {status.lower(): 0 for status in models.AppointmentStatus.__members__}
+    for _, _, day, _, status, _ in rows:
+        if start <= day <= end:
+            counts[status.lower()] += 1
+    return counts
+
+
+def exercise_write_paths(client, accounts, book, day):
+    """Book, approve, reschedule, cancel and bulk-change appointments through the API"""
+    doctor = accounts["doctor"]
+    first, second, third = (book(p, day, slot).json()["id"] for p, slot in ((1, 1), (2, 2), (3, 3)))
+    assert client.post(f"/appointments/{first}/approve", headers=doctor).status_code == 200
+    assert client.post(f"/appointments/{first}/reschedule", headers=accounts["patient1"],
+                       params={"new_date": day.isoformat(), "new_slot": 4}).status_code == 200
+    assert client.post(f"/appointments/{second}/reject", headers=doctor).status_code == 200
+    assert client.delete(f"/appointments/{third}", headers=doctor).status_code == 200
+
+    later = day + datetime.timedelta(days=7)
+    visits = [{"date": later.isoformat(), "slot": slot} for slot in (1, 2, 3)]
+    results = client.post("/appointments/bulk-book", headers=accounts["patient2"],
+                          json={"doctor_id": 1, "patient_id": 2, "visits": visits}).json()
+    ids = [r["appointment_id"] for r in results]
+    assert client.post("/appointments/bulk-approve", headers=doctor,
+                       json={"appointment_ids": ids[:2]}).status_code == 200
+    assert client.post("/appointments/bulk-reject", headers=doctor,
+                       json={"appointment_ids": ids[1:]}).status_code == 200
+
+
+def test_write_paths_keep_rollups_exact(client, accounts, book, day, db):
+    exercise_write_paths(client, accounts, book, day)
+    assert analytics.check(db) == []
+
+    end = day + datetime.timedelta(days=7)
+    report = client.get("/admin/analytics", headers=accounts["admin"],
+                        params={"start": day.isoformat(), "end": end.isoformat()}).json()
+    expected = expected_totals(all_appointments(db), day, end)
+    assert {status: report["totals"][status] for status in expected} == expected
+    assert expected["cancelled"] == 4 and expected["pending"] == 1 and expected["booked"] == 1
+
+
+def test_archiving_leaves_rollups_exact(client, accounts, book, day, db):
+    exercise_write_paths(client, accounts, book, day)
+    assert archive.archive_all(db, cutoff=day + datetime.timedelta(days=30), batch_size=2) == 2
+    assert analytics.check(db) == []
+
+
+def test_rebuild_counts_rows_written_behind_the_app(accounts, day, db):
+    with database.engine.begin() as conn:
+        conn.execute(models.Appointment.__table__.insert(), [
+            {"doctor_id": 1, "patient_id": 1, "date": day, "slot": 1, "status": "BOOKED",
+             "is_rescheduled": 0, "created_at": datetime.datetime.combine(day, datetime.time()) - datetime.timedelta(days=3)},
+        ])
+        conn.execute(models.AppointmentArchive.__table__.insert(), [
+            {"id": 100, "doctor_id": 1, "patient_id": 2, "date": day, "slot": 2, "status": "CANCELLED",
+             "is_rescheduled": 0, "created_at": None},
+        ])
+    assert len(analytics.check(db)) == 3  # the daily BOOKED and CANCELLED rows and the slot row
+
+    analytics.rebuild(db)
+    assert analytics.check(db) == []
+    report = analytics.report(db, day, day)
+    assert report["totals"]["booked"] == 1 and report["totals"]["cancelled"] == 1
+    assert report["totals"]["avg_lead_days"] == 3.0
+    assert report["busiest_slots"] == [{"weekday": day.weekday(), "slot": 1, "appointments": 1}]
+
+
+def test_report_reads_only_rollups(client, accounts, book, day, db):
+    book(1, day, 1)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        analytics.report(db, day, day)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    read = " ".join(statements)
+    assert "appointment_daily_stats" in read
+    assert re.search(r"\b(FROM|JOIN)\s+appointments(_archive)?\b", read) is None
+
+
+def test_slot_rollup_is_keyed_by_doctor(book, day, db):
+    with database.engine.begin() as conn:
+        conn.execute(models.Doctor.__table__.insert(), [{
+            "id": 2, "name": "Doctor 2", "email": "doctor2@example.com", "hashed_password": "x",
+            "license_number": "LIC-2", "is_verified": 1,
+        }])
+    assert book(1, day, 1).status_code == 200
+    crud.create_appointment(db, schemas.AppointmentCreate(doctor_id=2, patient_id=2, date=day, slot=1))
+
+    slot_stats = models.AppointmentSlotStats
+    rows = db.execute(select(slot_stats.doctor_id, slot_stats.appointments).where(slot_stats.date == day)).all()
+    assert sorted(rows) == [(1, 1), (2, 1)]
+    assert analytics.report(db, day, day)["busiest_slots"] == [{"weekday": day.weekday(), "slot": 1, "appointments": 2}]
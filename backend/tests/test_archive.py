@@ -0,0 +1,53 @@
+import datetime
+
+from sqlalchemy import select
+
+from app import archive, models
+
+
+def all_rows(db):
+    """{id: (doctor_id, patient_id, date, slot, status)} over the live and archived tables"""
+    rows = {}
+    for model in (models.Appointment, models.AppointmentArchive):
+        for row in db.execute(select(model.id, model.doctor_id, model.patient_id, model.date, model.slot, model.status)):
+            assert row.id not in rows, f"appointment {row.id} is both live and archived"
+            rows[row.id] = tuple(row[1:])
+    return rows
+
+
+def test_cancel_frees_the_slot(client, accounts, book, day):
+    first = book(1, day, 1).json()["id"]
+    assert book(2, day, 1).status_code == 409
+    assert client.delete(f"/appointments/{first}", headers=accounts["doctor"]).status_code == 200
+
+    assert book(2, day, 1).status_code == 200
+    # the cancelled row is history: later actions on it find nothing
+    assert client.post(f"/appointments/{first}/approve", headers=accounts["doctor"]).status_code == 404
+    availability = client.get("/doctors/1/availability", params={"date": day.isoformat()}).json()
+    assert [s["patient_id"] for s in availability["slots"] if not s["available"]] == [2]
+
+
+def test_bulk_reject_frees_the_slots(client, accounts, book, day, db):
+    ids = [book(1, day, slot).json()["id"] for slot in (1, 2)]
+    results = client.post("/appointments/bulk-reject", headers=accounts["doctor"],
+                          json={"appointment_ids": ids}).json()
+    assert [r["status"] for r in results] == ["CANCELLED", "CANCELLED"]
+
+    assert db.execute(select(models.Appointment.id)).all() == []
+    assert {r[4] for r in all_rows(db).values()} == {"CANCELLED"}
+    assert book(2, day, 1).status_code == 200
+
+
+def test_archiving_moves_rows_exactly_once(client, accounts, book, day, db):
+    first, second, third = (book(p, day, slot).json()["id"] for p, slot in ((1, 1), (2, 2), (3, 3)))
+    assert client.post(f"/appointments/{first}/approve", headers=accounts["doctor"]).status_code == 200
+    assert client.delete(f"/appointments/{third}", headers=accounts["doctor"]).status_code == 200
+    before = all_rows(db)
+
+    # a cutoff past every date archives everything, batch by batch
+    moved = archive.archive_all(db, cutoff=day + datetime.timedelta(days=1), batch_size=1)
+
+    assert moved == 2  # the cancelled row went to the archive when it was cancelled
+    assert all_rows(db) == before
+    assert db.execute(select(models.Appointment.id)).all() == []
+    assert archive.archive_all(db, cutoff=day + datetime.timedelta(days=1)) == 0
@@ -0,0 +1,34 @@
+import io
+
+from sqlalchemy import event, func, select
+
+from app import analytics, bulk_import, database, models
+
+CSV = "doctor_id,patient_id,date,slot,status\n1,1,{day},1,CANCELLED\n1,2,{day},2,BOOKED\n"
+
+
+def test_replayed_chunk_is_rejected(accounts, day, db):
+    history = CSV.format(day=day.isoformat())
+    assert bulk_import.run("appointments", io.StringIO(history), "csv", workers=1) == (2, 0)
+    # a crash before the checkpoint write replays the chunk
+    assert bulk_import.run("appointments", io.StringIO(history), "csv", workers=1) == (0, 2)
+
+    assert db.execute(select(func.count()).select_from(models.Appointment)).scalar() == 1
+    assert db.execute(select(func.count()).select_from(models.AppointmentArchive)).scalar() == 1
+    assert analytics.check(db) == []
+
+
+def test_archiving_is_limited_to_the_chunk(accounts, day):
+    history = CSV.format(day=day.isoformat())
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        bulk_import.run("appointments", io.StringIO(history), "csv", workers=1)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    moves = [s for s in statements if s.startswith("DELETE FROM appointments")]
+    assert moves and all("appointments.id >" in s for s in moves)
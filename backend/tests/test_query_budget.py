@@ -0,0 +1,10 @@
+import asyncio
+
+from benchmarks import query_budget
+
+
+def test_endpoints_within_query_budget():
+    query_budget.seed()
+    counts = asyncio.run(query_budget.measure())
+    over = {name: (counts[name], budget) for name, budget in query_budget.BUDGETS.items() if counts[name] > budget}
+    assert over == {}
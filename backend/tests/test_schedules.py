@@ -0,0 +1,28 @@
+import datetime
+
+from app import schedules
+
+
+def put_exception(client, accounts, day, **hours):
+    return client.put("/doctors/me/schedule/exceptions", headers=accounts["doctor"],
+                      json={"date": day.isoformat(), **hours})
+
+
+def test_exception_keeps_breaks_inside_its_hours(client, accounts, db):
+    day = datetime.date.today() + datetime.timedelta(days=7)
+    # the legacy day: 9-18 with lunch 13-14, in two-hour slots
+    assert put_exception(client, accounts, day, start="10:00", end="16:00", slot_minutes=60).status_code == 200
+
+    template = schedules.load_schedules(db, [1])[1].template_for(day)
+    assert template.breaks == ((datetime.time(13), datetime.time(14)),)
+    assert [(start.hour, end.hour) for _, start, end in schedules.day_slots(template)] == [
+        (10, 11), (11, 12), (12, 13), (14, 15), (15, 16),
+    ]
+
+
+def test_exception_clips_and_drops_breaks():
+    lunch = ((datetime.time(13), datetime.time(14)),)
+    assert schedules.clip_breaks(lunch, datetime.time(13, 30), datetime.time(18)) == (
+        (datetime.time(13, 30), datetime.time(14)),
+    )
+    assert schedules.clip_breaks(lunch, datetime.time(8), datetime.time(12)) == ()
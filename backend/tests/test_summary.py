@@ -0,0 +1,24 @@
+from sqlalchemy import event
+
+from app import database
+
+
+def test_summary_counts_live_and_archived_from_the_rollup(client, accounts, book, day):
+    first = book(1, day, 1).json()["id"]
+    book(2, day, 2)
+    assert client.delete(f"/appointments/{first}", headers=accounts["doctor"]).status_code == 200
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        summary = client.get("/doctors/me/summary", headers=accounts["doctor"],
+                             params={"start": day.isoformat(), "end": day.isoformat()}).json()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    totals = summary["totals"]
+    assert (totals["pending"], totals["cancelled"], totals["offered"]) == (1, 1, 4)
+    assert not any("FROM appointments" in statement for statement in statements)
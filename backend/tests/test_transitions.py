@@ -0,0 +1,53 @@
+import pytest
+
+from app import crud, crud_async, database, models
+from app.crud import AppointmentChanged
+
+
+def load(appointment_id):
+    with database.SessionLocal() as db:
+        appt = crud.get_appointment(db, appointment_id)
+        db.expunge(appt)
+    return appt
+
+
+def test_stale_entity_raises_appointment_changed(book, day):
+    appointment_id = book(1, day, 1).json()["id"]
+    stale = load(appointment_id)
+    with database.SessionLocal() as db:
+        crud.transition_appointment(db, crud.get_appointment(db, appointment_id), "approve")
+
+    with database.SessionLocal() as db:
+        db.add(stale)
+        with pytest.raises(AppointmentChanged):
+            crud.transition_appointment(db, stale, "approve")
+        assert crud.get_appointment(db, appointment_id).status == "BOOKED"
+
+
+def test_status_changed_after_load_is_409(client, accounts, book, day, monkeypatch):
+    appointment_id = book(1, day, 1).json()["id"]
+    get_appointment = crud_async.get_appointment
+
+    async def get_then_cancel_elsewhere(db, appointment_id):
+        # another request cancels the appointment between this handler's load and its write
+        appt = await get_appointment(db, appointment_id)
+        with database.SessionLocal() as other:
+            crud.transition_appointment(other, crud.get_appointment(other, appointment_id), "cancel")
+        return appt
+
+    monkeypatch.setattr(crud_async, "get_appointment", get_then_cancel_elsewhere)
+    response = client.post(f"/appointments/{appointment_id}/approve", headers=accounts["doctor"])
+    assert response.status_code == 409
+    monkeypatch.undo()
+
+    with database.SessionLocal() as db:
+        assert crud.get_appointment(db, appointment_id) is None
+        archived = db.get(models.AppointmentArchive, appointment_id)
+        assert archived.status == "CANCELLED"
+
+
+def test_invalid_transition_is_400(client, accounts, book, day):
+    appointment_id = book(1, day, 1).json()["id"]
+    assert client.post(f"/appointments/{appointment_id}/approve", headers=accounts["doctor"]).status_code == 200
+    assert client.post(f"/appointments/{appointment_id}/approve", headers=accounts["doctor"]).status_code == 400
+
@@ -58,6 +58,16 @@ export const api = {
   },
 
   // Get doctor availability
+  getNextAvailable: async (token: string, doctorIds: number[], limit = 1) => {
+    const params = new URLSearchParams({ limit: String(limit) });
+    doctorIds.forEach((id) => params.append("doctor_ids", String(id)));
+    const res = await fetch(`${API_BASE}/slots/next-available?${params}`, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) throw new Error("Failed to search for free slots");
+    return res.json();
+  },
+
   getDoctorAvailability: async (
     token: string,
     doctorId: number,
@@ -71,6 +81,39 @@ export const api = {
     return res.json();
   },
 
+  // Get booked-slot and offered-slot bitmaps for several doctors over a date range
+  getAvailabilityGrid: async (
+    token: string,
+    doctorIds: number[],
+    start: string,
+    end: string
+  ) => {
+    const params = new URLSearchParams({ start, end });
+    doctorIds.forEach((id) => params.append("doctor_ids", String(id)));
+    const res = await fetch(
+      `${API_BASE}/doctors/availability-grid?${params.toString()}`,
+      { headers: { Authorization: `Bearer ${token}` } }
+    );
+    if (!res.ok) throw new Error("Failed to fetch availability grid");
+    // { start, end, slots_per_day, doctors: [{ doctor_id, booked, open }] }: one hex string per day, bit (slot - 1)
+    // set when the slot is taken / offered; parse with BigInt("0x" + mask), a day can exceed 53 bits
+    return res.json();
+  },
+
+  // Subscribe to slot changes for a doctor/date; returns an unsubscribe function
+  subscribeAvailability: (
+    doctorId: number,
+    date: string,
+    onChange: () => void
+  ) => {
+    const source = new EventSource(
+      `${API_BASE}/availability/stream?keys=${doctorId}:${date}`
+    );
+    source.addEventListener("slot-change", onChange);
+    source.addEventListener("resync", onChange);
+    return () => source.close();
+  },
+
   // Book appointment
   bookAppointment: async (token: string, data: any) => {
     const res = await fetch(`${API_BASE}/appointments/book`, {
@@ -89,21 +132,52 @@ export const api = {
   },
 
   // Get appointments for patient
-  getMyPatientAppointments: async (token: string) => {
-    const res = await fetch(`${API_BASE}/patients/me/appointments`, {
+  getMyPatientAppointments: async (token: string, cursor?: string) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const res = await fetch(`${API_BASE}/patients/me/appointments${query}`, {
       headers: { Authorization: `Bearer ${token}` },
     });
     if (!res.ok) throw new Error("Failed to fetch patient appointments");
-    return res.json();
+    return res.json(); // { items, next_cursor }
   },
 
   // Get appointments for doctor
-  getMyDoctorAppointments: async (token: string) => {
-    const res = await fetch(`${API_BASE}/doctors/me/appointments`, {
+  getMyDoctorAppointments: async (token: string, cursor?: string) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const res = await fetch(`${API_BASE}/doctors/me/appointments${query}`, {
       headers: { Authorization: `Bearer ${token}` },
     });
     if (!res.ok) throw new Error("Failed to fetch doctor appointments");
-    return res.json();
+    return res.json(); // { items, next_cursor }
+  },
+
+  // Archived (past, cancelled or rejected) appointments for patient / doctor, oldest first
+  getMyPatientAppointmentHistory: async (token: string, cursor?: string) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const res = await fetch(`${API_BASE}/patients/me/appointments/history${query}`, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) throw new Error("Failed to fetch appointment history");
+    return res.json(); // { items, next_cursor }; items carry archived_at
+  },
+
+  getMyDoctorAppointmentHistory: async (token: string, cursor?: string) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const res = await fetch(`${API_BASE}/doctors/me/appointments/history${query}`, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) throw new Error("Failed to fetch appointment history");
+    return res.json(); // { items, next_cursor }; items carry archived_at
+  },
+
+  // Per-day (or per-week) status counts and slot utilization for the doctor dashboard
+  getMyDoctorSummary: async (token: string, start: string, end: string, group: "day" | "week" = "day") => {
+    const query = new URLSearchParams({ start, end, group });
+    const res = await fetch(`${API_BASE}/doctors/me/summary?${query}`, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) throw new Error("Failed to fetch schedule summary");
+    return res.json(); // { doctor_id, start, end, group, rows, totals }
   },
 
   // Cancel appointment
@@ -145,6 +219,24 @@ export const api = {
     return res.json();
   },
 
+  // Approve / reject many appointments at once (doctor)
+  bulkUpdateAppointments: async (
+    token: string,
+    action: "approve" | "reject",
+    appointmentIds: number[]
+  ) => {
+    const res = await fetch(`${API_BASE}/appointments/bulk-${action}`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${token}`,
+      },
+      body: JSON.stringify({ appointment_ids: appointmentIds }),
+    });
+    if (!res.ok) throw new Error(`Failed to ${action} appointments`);
+    return res.json(); // [{ appointment_id, ok, status, error }]
+  },
+
   // Reschedule appointment (patient)
   rescheduleAppointment: async (
     token: string,
@@ -3,6 +3,8 @@ import { api } from "../api";
 
 interface Slot {
   slot: number;
+  start: string;
+  end: string;
   available: boolean;
   appointment_id: number | null;
   patient_id: number | null;
@@ -14,12 +16,11 @@ interface Props {
   onBack: () => void;
 }
 
-const SLOT_TIMES = [
-  "9:00 AM - 11:00 AM",
-  "11:00 AM - 1:00 PM",
-  "2:00 PM - 4:00 PM",
-  "4:00 PM - 6:00 PM",
-];
+// "09:15:00" -> "9:15 AM"
+export const formatTime = (t: string) => {
+  const [h, m] = t.split(":").map(Number);
+  return `${h % 12 || 12}:${String(m).padStart(2, "0")} ${h < 12 ? "AM" : "PM"}`;
+};
 
 export const DoctorAvailability: React.FC<Props> = ({
   doctorId,
@@ -32,6 +33,8 @@ export const DoctorAvailability: React.FC<Props> = ({
 
   useEffect(() => {
     loadAvailability();
+    // reload when the server reports a change to this doctor/date instead of polling
+    return api.subscribeAvailability(doctorId, date, loadAvailability);
   }, [date]);
 
   const loadAvailability = async () => {
@@ -47,6 +50,21 @@ export const DoctorAvailability: React.FC<Props> = ({
     }
   };
 
+  // jump straight to the first date with a free slot instead of trying dates one by one
+  const handleNextAvailable = async () => {
+    try {
+      const token = localStorage.getItem("token")!;
+      const data = await api.getNextAvailable(token, [doctorId]);
+      if (data.slots.length === 0) {
+        alert(`No free slots until ${data.searched_until}`);
+      } else {
+        setDate(data.slots[0].date);
+      }
+    } catch (err: any) {
+      alert(err.message);
+    }
+  };
+
   const handleBook = async (slot: number) => {
     if (!confirm(`Book slot ${slot} on ${date}?`)) return;
 
@@ -81,12 +99,14 @@ export const DoctorAvailability: React.FC<Props> = ({
           onChange={(e) => setDate(e.target.value)}
           min={minDate}
         />
+        <button onClick={handleNextAvailable}>Next available</button>
       </div>
 
       {loading ? (
         <div className="loading">Loading slots...</div>
       ) : (
         <div className="slots-grid">
+          {slots.length === 0 && <p>No slots on this date</p>}
           {slots.map((slot) => (
             <div
               key={slot.slot}
@@ -94,7 +114,9 @@ export const DoctorAvailability: React.FC<Props> = ({
             >
               <div className="slot-time">
                 <strong>Slot {slot.slot}</strong>
-                <span>{SLOT_TIMES[slot.slot - 1]}</span>
+                <span>
+                  {formatTime(slot.start)} - {formatTime(slot.end)}
+                </span>
               </div>
               {slot.available ? (
                 <button
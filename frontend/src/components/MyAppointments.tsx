@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { api } from "../api";
+import { formatTime } from "./DoctorAvailability";
 
 interface Appointment {
   id: number;
@@ -7,7 +8,16 @@ interface Appointment {
   patient_id?: number;
   date: string;
   slot: number;
+  start?: string | null; // slot times under the doctor's schedule (live feed only)
+  end?: string | null;
   status: "PENDING" | "BOOKED" | "CANCELLED" | "REJECTED";
+  archived_at?: string; // history feed only
+}
+
+interface FreeSlot {
+  slot: number;
+  start: string;
+  end: string;
 }
 
 interface Props {
@@ -23,20 +33,41 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
   const [message, setMessage] = useState("");
   const [rescheduleId, setRescheduleId] = useState<number | null>(null);
   const [newDate, setNewDate] = useState("");
-  const [newSlot, setNewSlot] = useState(1);
-
-  const SLOT_TIMES = [
-    "9:00 AM - 11:00 AM",
-    "11:00 AM - 1:00 PM",
-    "2:00 PM - 4:00 PM",
-    "4:00 PM - 6:00 PM",
-  ];
+  const [newSlot, setNewSlot] = useState<number | null>(null);
+  const [freeSlots, setFreeSlots] = useState<FreeSlot[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  // cancelled / rejected appointments leave the live feed at once and past ones once archived
+  const [history, setHistory] = useState<Appointment[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
 
   useEffect(() => {
     loadAppointments();
+    loadHistory();
   }, []);
 
-  const loadAppointments = async () => {
+  const loadHistory = async (cursor?: string) => {
+    const token = localStorage.getItem("token");
+    if (!token) return;
+
+    try {
+      const page =
+        userRole === "patient"
+          ? await api.getMyPatientAppointmentHistory(token, cursor)
+          : await api.getMyDoctorAppointmentHistory(token, cursor);
+      setHistory((prev) => (cursor ? [...prev, ...page.items] : page.items));
+      setHistoryCursor(page.next_cursor);
+    } catch (err: any) {
+      setError(err.message || "Failed to load appointment history");
+    }
+  };
+
+  // a cancel or reject moves the appointment from the live feed to the history
+  const reloadAll = () => {
+    loadAppointments();
+    loadHistory();
+  };
+
+  const loadAppointments = async (cursor?: string) => {
     const token = localStorage.getItem("token");
     if (!token) {
       setError("Not logged in");
@@ -45,11 +76,12 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
     }
 
     try {
-      const data =
+      const page =
         userRole === "patient"
-          ? await api.getMyPatientAppointments(token)
-          : await api.getMyDoctorAppointments(token);
-      setAppointments(data);
+          ? await api.getMyPatientAppointments(token, cursor)
+          : await api.getMyDoctorAppointments(token, cursor);
+      setAppointments((prev) => (cursor ? [...prev, ...page.items] : page.items));
+      setNextCursor(page.next_cursor);
     } catch (err: any) {
       setError(err.message || "Failed to load appointments");
     } finally {
@@ -81,7 +113,7 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
     try {
       await api.rejectAppointment(token, appointmentId);
       setMessage("Appointment rejected!");
-      loadAppointments();
+      reloadAll();
     } catch (err: any) {
       setError(err.message || "Failed to reject appointment");
     } finally {
@@ -89,6 +121,24 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
     }
   };
 
+  // the slots on offer depend on the doctor's schedule for that date
+  const handleNewDate = async (appt: Appointment, date: string) => {
+    setNewDate(date);
+    setFreeSlots([]);
+    setNewSlot(null);
+    const token = localStorage.getItem("token");
+    if (!token || !date || appt.doctor_id === undefined) return;
+
+    try {
+      const availability = await api.getDoctorAvailability(token, appt.doctor_id, date);
+      const free: FreeSlot[] = availability.slots.filter((s: FreeSlot & { available: boolean }) => s.available);
+      setFreeSlots(free);
+      setNewSlot(free.length ? free[0].slot : null);
+    } catch (err: any) {
+      setError(err.message || "Failed to load free slots");
+    }
+  };
+
   const handleReschedule = async (appointmentId: number) => {
     const token = localStorage.getItem("token");
     if (!token) return;
@@ -97,6 +147,10 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
       setError("Please select a new date");
       return;
     }
+    if (newSlot === null) {
+      setError("No free slot on that date");
+      return;
+    }
 
     setActionLoading(appointmentId);
     try {
@@ -104,7 +158,8 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
       setMessage("Appointment rescheduled! Doctor will need to accept again.");
       setRescheduleId(null);
       setNewDate("");
-      setNewSlot(1);
+      setNewSlot(null);
+      setFreeSlots([]);
       loadAppointments();
     } catch (err: any) {
       setError(err.message || "Failed to reschedule appointment");
@@ -123,7 +178,7 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
     try {
       await api.patientCancelAppointment(token, appointmentId);
       setMessage("Appointment cancelled!");
-      loadAppointments();
+      reloadAll();
     } catch (err: any) {
       setError(err.message || "Failed to cancel appointment");
     } finally {
@@ -146,6 +201,27 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
     }
   };
 
+  const formatSlot = (appt: Appointment) =>
+    appt.start && appt.end ? `${formatTime(appt.start)} - ${formatTime(appt.end)}` : `Slot ${appt.slot}`;
+
+  const statusBadge = (status: Appointment["status"]) => (
+    <span
+      style={{
+        backgroundColor: getStatusColor(status),
+        color: "white",
+        padding: "4px 8px",
+        borderRadius: "4px",
+        fontSize: "12px",
+      }}
+    >
+      {status === "PENDING" && "⏳"}
+      {status === "BOOKED" && "✅"}
+      {status === "CANCELLED" && "❌"}
+      {status === "REJECTED" && "❌"}
+      {" " + status}
+    </span>
+  );
+
   if (loading) return <div>Loading appointments...</div>;
 
   return (
@@ -175,25 +251,10 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
                 <strong>📅 Date:</strong> {appt.date}
               </p>
               <p style={{ margin: "5px 0" }}>
-                <strong>⏰ Time:</strong> {SLOT_TIMES[appt.slot - 1]}
+                <strong>⏰ Time:</strong> {formatSlot(appt)}
               </p>
               <p style={{ margin: "5px 0" }}>
-                <strong>Status:</strong>{" "}
-                <span
-                  style={{
-                    backgroundColor: getStatusColor(appt.status),
-                    color: "white",
-                    padding: "4px 8px",
-                    borderRadius: "4px",
-                    fontSize: "12px",
-                  }}
-                >
-                  {appt.status === "PENDING" && "⏳"}
-                  {appt.status === "BOOKED" && "✅"}
-                  {appt.status === "CANCELLED" && "❌"}
-                  {appt.status === "REJECTED" && "❌"}
-                  {" " + appt.status}
-                </span>
+                <strong>Status:</strong> {statusBadge(appt.status)}
               </p>
             </div>
 
@@ -238,17 +299,16 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
               </div>
             )}
 
-            {userRole === "doctor" && appt.status === "CANCELLED" && (
-              <div style={{ marginTop: "10px", padding: "10px", backgroundColor: "#ffebee", borderRadius: "4px" }}>
-                <p style={{ margin: "0", color: "#c62828" }}>❌ <strong>Patient cancelled this appointment</strong></p>
-              </div>
-            )}
-
             {userRole === "patient" && appt.status === "BOOKED" && (
               <div style={{ marginTop: "10px" }}>
                 <div style={{ display: "flex", gap: "10px", marginBottom: "10px" }}>
                   <button
-                    onClick={() => setRescheduleId(rescheduleId === appt.id ? null : appt.id)}
+                    onClick={() => {
+                      setRescheduleId(rescheduleId === appt.id ? null : appt.id);
+                      setNewDate("");
+                      setNewSlot(null);
+                      setFreeSlots([]);
+                    }}
                     disabled={actionLoading === appt.id}
                     style={{
                       backgroundColor: "#2196F3",
@@ -295,7 +355,7 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
                     <input
                       type="date"
                       value={newDate}
-                      onChange={(e) => setNewDate(e.target.value)}
+                      onChange={(e) => handleNewDate(appt, e.target.value)}
                       min={new Date().toISOString().split("T")[0]}
                       style={{
                         padding: "8px",
@@ -306,8 +366,9 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
                       }}
                     />
                     <select
-                      value={newSlot}
+                      value={newSlot ?? ""}
                       onChange={(e) => setNewSlot(parseInt(e.target.value))}
+                      disabled={freeSlots.length === 0}
                       style={{
                         padding: "8px",
                         marginRight: "10px",
@@ -316,9 +377,12 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
                         border: "1px solid #ccc",
                       }}
                     >
-                      {SLOT_TIMES.map((time, idx) => (
-                        <option key={idx} value={idx + 1}>
-                          {time}
+                      {freeSlots.length === 0 && (
+                        <option value="">{newDate ? "No free slots" : "Pick a date first"}</option>
+                      )}
+                      {freeSlots.map((s) => (
+                        <option key={s.slot} value={s.slot}>
+                          {formatTime(s.start)} - {formatTime(s.end)}
                         </option>
                       ))}
                     </select>
@@ -345,6 +409,44 @@ export const MyAppointments: React.FC<Props> = ({ userId, userRole }) => {
           </div>
         ))
       )}
+
+      {nextCursor && (
+        <button onClick={() => loadAppointments(nextCursor)} style={{ marginTop: "10px" }}>
+          Load more
+        </button>
+      )}
+
+      <h3 style={{ marginTop: "30px" }}>🗂️ Past / cancelled</h3>
+      {history.length === 0 ? (
+        <p>No past or cancelled appointments</p>
+      ) : (
+        history.map((appt) => (
+          <div
+            key={appt.id}
+            style={{
+              border: "1px solid #eee",
+              borderRadius: "8px",
+              padding: "10px 15px",
+              margin: "8px 0",
+              backgroundColor: "#fafafa",
+              color: "#555",
+            }}
+          >
+            <p style={{ margin: "5px 0" }}>
+              <strong>📅 Date:</strong> {appt.date} &nbsp; <strong>⏰ Time:</strong> {formatSlot(appt)}
+            </p>
+            <p style={{ margin: "5px 0" }}>
+              <strong>Status:</strong> {statusBadge(appt.status)}
+            </p>
+          </div>
+        ))
+      )}
+
+      {historyCursor && (
+        <button onClick={() => loadHistory(historyCursor)} style={{ marginTop: "10px" }}>
+          Load more history
+        </button>
+      )}
     </div>
   );
 };